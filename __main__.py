@@ -11,6 +11,23 @@ if __name__ == '__main__':
     parser.add_argument("vehicle", type=str, help="The vehicle configuration to use. Use \"AUTO\" to automatically detect the vehicle.")
     parser.add_argument("-d", "--debug", action='store_true', help="Enables debug information.")
     parser.add_argument("-bt", "--btcontroller", action='store_true', help="Enables Bluetooth controller mode.")
+    parser.add_argument("--no-cache", action='store_true', help="Always runs the full auto-detection instead of starting the last detected vehicle (AUTO only).")
+    parser.add_argument("--uds-periodic", action='store_true', help="Sends the UDS polling messages at fixed intervals instead of waiting for the response to the previous request to each ECU.")
+    parser.add_argument("--asyncio", action='store_true', help="Runs the CAN buses, UDS polling and gamepad output on a single asyncio event loop instead of threads (not in Bluetooth controller mode).")
+    parser.add_argument("--gamepad", choices=["device", "null", "recording"], default="device", help="Gamepad backend: the virtual or Bluetooth gamepad device, a null gamepad, or a null gamepad recording all calls and printing report rate and jitter statistics (for load tests).")
+    parser.add_argument("--status-rate", type=float, default=5.0, help="Refresh rate in Hz of the status line printed in debug mode, 0 disables it.")
+    parser.add_argument("--linear-dispatch", action='store_true', help="Matches CAN frames against all signal configurations in order instead of using the precompiled dispatch table.")
+    parser.add_argument("--output-tick", type=float, default=0.01, help="Minimum time in seconds between two gamepad reports, reports are only sent if the gamepad state changed. Use a negative value to send every update immediately.")
+    parser.add_argument("--metrics", action='store_true', help="Enables frame, decode time, report rate and latency metrics.")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="Interval in seconds for printing the metrics summary, 0 disables the summary.")
+    parser.add_argument("--metrics-endpoint", type=str, default=None, help="Serves the metrics as JSON on \"<host>:<port>\" (HTTP) or \"unix:<path>\".")
+    parser.add_argument("--replay", type=str, default=None, help="Replays a CAN log (e.g. .asc, .blf, candump .log) instead of reading from the CAN bus.")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="Playback speed of --replay, 1 for real time, 0 for as fast as possible.")
+    parser.add_argument("--record", type=str, default=None, help="File to record the gamepad reports of --replay to.")
+    parser.add_argument("--benchmark", type=str, default=None, help="Benchmarks the decoding of synthetic frames for the vehicle (\"ALL\" for all vehicles) and writes the results to the given JSON file.")
+    parser.add_argument("--benchmark-frames", type=int, default=20000, help="Number of synthetic frames per vehicle for --benchmark.")
+    parser.add_argument("--benchmark-runtime", type=str, default=None, help="Also compares the threaded and the asyncio runtime for --benchmark by sending the frames over the given SocketCAN interface (e.g. vcan0), or \"virtual\" for the python-can virtual bus.")
+    parser.add_argument("--benchmark-baseline", type=str, default=None, help="JSON results of an earlier --benchmark run, fails if the median cost of a benchmark rose by more than 25%%.")
     args = parser.parse_args()
     
     print("""
@@ -21,11 +38,23 @@ __     ______   ____
    \_/  |_____|\____|
            """)
 
-    if args.btcontroller:
+    if args.benchmark:
+        import v2g_controller.benchmark as benchmark
+        print("Benchmark mode selected.")
+        benchmark.start(args)
+    elif args.replay:
+        import v2g_controller.replay as replay
+        print("Replay mode selected.")
+        replay.start(args)
+    elif args.btcontroller:
         import v2g_controller.gamepads.HIDpi.hidpi.main as hidpi_main
         print("Bluetooth controller mode selected.")
         hidpi_main.start(args, v2g_main.start)
+        v2g_main.restart_if_requested()
     else:
         print("Virtual controller mode selected.")
-        v2g_main.start(args)
-        v2g_main.loop()
\ No newline at end of file
+        if args.asyncio:
+            v2g_main.run_async(args)
+        else:
+            v2g_main.start(args)
+            v2g_main.loop()
\ No newline at end of file
@@ -0,0 +1,383 @@
+import json
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+
+import can
+
+import v2g_controller.configuration_helper as cfh
+from v2g_controller.helper import debug, range_map
+from v2g_controller.car_connector import CarConnector
+from v2g_controller.metrics import Metrics
+from v2g_controller.output import OutputThread, AsyncioOutput
+from v2g_controller.isotp import IsoTpListener
+from v2g_controller.uds_poller import response_channels
+from v2g_controller.gamepads.nullgamepad.nullgamepad import NullGamepad
+
+# Valid CAN FD payload lengths
+FD_LENGTHS = (8, 12, 16, 20, 24, 32, 48, 64)
+# Time between two synthetic frames, roughly a busy 500 kbit/s bus
+FRAME_INTERVAL = 0.0004
+
+
+def _payload_length(config: cfh.SignalConfiguration):
+    end = config.can_signal.byte + config.can_signal.length - 1
+    for length in FD_LENGTHS:
+        if end <= length:
+            return length
+    return FD_LENGTHS[-1]
+
+
+def _uds_response(config: cfh.SignalConfiguration, rng):
+    """
+    Returns a single frame ReadDataByIdentifier response carrying random data for the DID of a configuration.
+    """
+    response = bytearray([0x62, config.did >> 8, config.did & 0xFF])
+    response += bytearray(rng.randrange(256) for _ in range(config.can_signal.byte + config.can_signal.length - 1))
+    if len(response) <= 7:
+        return bytearray([len(response)]) + response + bytearray([0x55] * (7 - len(response)))
+    # CAN FD single frame
+    data = bytearray([0, len(response)]) + response
+    length = next(length for length in FD_LENGTHS if length >= len(data))
+    return data + bytearray([0x55] * (length - len(data)))
+
+
+def _did_data(data, did):
+    """
+    Returns the data of a single frame response to the DID, else None.
+    """
+    offset = 1 if data[0] else 2
+    if data[offset] != 0x62 or (data[offset + 1] << 8) | data[offset + 2] != did:
+        return None
+    return memoryview(data)[offset + 3 :]
+
+
+def synthetic_frames(vehicle: cfh.VehicleConfiguration, count, seed=0, noise=0.1):
+    """
+    Generates frames carrying random values for all signals of a vehicle.
+
+    The frames use the real IDs, payload lengths and UDS ident and
+    first-byte filters of the configurations. Signals configured by DID are
+    carried by single frame UDS responses. A fraction of the frames
+    uses IDs not configured for the vehicle.
+
+    Args:
+    vehicle: The vehicle configuration.
+    count: Number of frames.
+    seed: Seed of the random generator.
+    noise: Fraction of frames with unrelated IDs.
+    """
+    rng = random.Random(seed)
+    configured_ids = {config.can_signal.id for config in vehicle.configurations}
+    noise_ids = [can_id for can_id in range(0x100, 0x200) if can_id not in configured_ids]
+    frames = []
+    timestamp = 1.0
+    for _ in range(count):
+        timestamp += FRAME_INTERVAL
+        if rng.random() < noise:
+            can_id = rng.choice(noise_ids)
+            data = bytearray(rng.randrange(256) for _ in range(8))
+        else:
+            config = rng.choice(vehicle.configurations)
+            can_id = config.can_signal.id
+            if config.did is not None:
+                data = _uds_response(config, rng)
+            else:
+                data = bytearray(rng.randrange(256) for _ in range(_payload_length(config)))
+            if config.cf_filter != []:
+                data[0] = config.cf_filter[0]
+            if config.ident_filter != []:
+                ident_pos = 2 if config.ident_filter_mf == False else 3
+                data[ident_pos] = config.ident_filter[0]
+                data[ident_pos + 1] = config.ident_filter[1]
+        frames.append(
+            can.Message(
+                arbitration_id=can_id,
+                data=data,
+                is_fd=len(data) > 8,
+                timestamp=timestamp,
+                channel="bench",
+            )
+        )
+    return frames
+
+
+def _statistics(durations):
+    """
+    Returns frames per second and per-call percentiles of durations given in nanoseconds.
+    """
+    if not durations:
+        return {"calls": 0}
+    durations = sorted(durations)
+    total = sum(durations)
+    return {
+        "calls": len(durations),
+        "per_second": len(durations) / (total / 1e9) if total > 0 else 0.0,
+        "mean_us": total / len(durations) / 1e3,
+        "p50_us": durations[len(durations) // 2] / 1e3,
+        "p99_us": durations[min(len(durations) - 1, int(len(durations) * 0.99))] / 1e3,
+    }
+
+
+def _time_calls(function, arguments):
+    durations = []
+    clock = time.perf_counter_ns
+    for argument in arguments:
+        start = clock()
+        function(*argument)
+        durations.append(clock() - start)
+    return durations
+
+
+def benchmark_vehicle(vehicle: cfh.VehicleConfiguration, frames, output_tick=0.01):
+    """
+    Measures the per-frame cost of the decoding hot paths of a vehicle.
+    """
+    result = {}
+    for mode, linear in (("dispatch", False), ("linear", True)):
+        connector = CarConnector(NullGamepad(), vehicle, linear_dispatch=linear, output_tick=output_tick)
+        durations = _time_calls(connector.on_message_received, [(msg,) for msg in frames])
+        result[f"on_message_received_{mode}"] = _statistics(durations)
+
+    channels = response_channels(vehicle.polling_messages) if vehicle.operation_mode == cfh.OperationMode.UDS else {}
+    if channels:
+        # reassembly and decoding of the UDS responses
+        connector = CarConnector(NullGamepad(), vehicle, output_tick=output_tick)
+        transport = IsoTpListener(None, channels, connector.on_pdu)
+        responses = [(msg,) for msg in frames if msg.arbitration_id in channels]
+        result["uds_responses"] = _statistics(_time_calls(transport.on_message_received, responses))
+
+    signals = {}
+    for config in vehicle.configurations:
+        if config.did is not None:
+            # data after the DID of the single frame responses
+            payloads = [
+                (_did_data(msg.data, config.did),)
+                for msg in frames
+                if msg.arbitration_id == config.can_signal.id and _did_data(msg.data, config.did) is not None
+            ]
+        else:
+            payloads = [
+                (msg.data,)
+                for msg in frames
+                if msg.arbitration_id == config.can_signal.id
+                and len(msg.data) >= config.can_signal.byte + config.can_signal.length - 1
+            ]
+        signals[f"{config.id}:{config.name}"] = _statistics(_time_calls(config.value, payloads))
+    result["signals"] = signals
+
+    connector = CarConnector(NullGamepad(), vehicle)
+    rng = random.Random(1)
+    angles = [
+        (rng.uniform(-1.0, 1.0), vehicle.steering_exponent, -vehicle.steering_max, vehicle.steering_max, vehicle.steering_deadzone)
+        for _ in range(len(frames))
+    ]
+    result["steering_map"] = _statistics(_time_calls(connector.steering_map, angles))
+    return result
+
+
+def _send_frames(bus, frames, interval, burst=10):
+    """
+    Sends the frames in bursts, paced to one frame per interval on average.
+    """
+    start = time.perf_counter()
+    for index in range(0, len(frames), burst):
+        delay = start + index * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        for msg in frames[index : index + burst]:
+            bus.send(msg)
+
+
+def benchmark_runtime(vehicle: cfh.VehicleConfiguration, frames, use_asyncio, channel="virtual", output_tick=0.01):
+    """
+    Sends the frames over a CAN bus to the threaded or the asyncio runtime and measures
+    the CPU time and context switches per frame and the latency from reception to report.
+    The UDS responses among the frames are reassembled and decoded as in benchmark_vehicle().
+
+    Args:
+    channel: SocketCAN interface (e.g. a vcan interface), or "virtual" for the python-can
+             virtual bus. The virtual bus has no file descriptor, so the asyncio runtime
+             still needs a reader thread on it.
+    """
+    import asyncio
+
+    if channel == "virtual":
+        receiver = can.Bus(interface="virtual", channel="v2g-benchmark")
+        sender = can.Bus(interface="virtual", channel="v2g-benchmark")
+    else:
+        receiver = can.Bus(interface="socketcan", channel=channel, fd=True)
+        sender = can.Bus(interface="socketcan", channel=channel, fd=True)
+    run_metrics = Metrics()
+    connector = CarConnector(NullGamepad(), vehicle, output_tick=output_tick, metrics=run_metrics)
+    loop = asyncio.new_event_loop() if use_asyncio else None
+    listeners = [connector]
+    if vehicle.operation_mode == cfh.OperationMode.UDS:
+        # the synthetic responses are decoded like a replayed log, without polling the bus
+        listeners.append(IsoTpListener(None, response_channels(vehicle.polling_messages), connector.on_pdu))
+    notifier = can.Notifier(receiver, listeners, loop=loop)
+    output = None
+    if connector.aggregator is not None:
+        connector.flush_inline = False
+        output = AsyncioOutput(connector.aggregator, loop) if use_asyncio else OutputThread(connector.aggregator)
+        output.watch(connector)
+        output.start()
+
+    def done():
+        return connector.frames >= len(frames) or (not sending.is_alive() and time.perf_counter() > deadline)
+
+    async def wait():
+        while not done():
+            await asyncio.sleep(0.01)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = time.process_time()
+    start = time.perf_counter()
+    deadline = start + len(frames) * FRAME_INTERVAL + 1.0
+    sending = threading.Thread(target=_send_frames, args=(sender, frames, FRAME_INTERVAL))
+    sending.start()
+    if use_asyncio:
+        loop.run_until_complete(wait())
+    else:
+        while not done():
+            time.sleep(0.01)
+    duration = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    sending.join()
+
+    notifier.stop()
+    if output is not None:
+        output.stop()
+    if loop is not None:
+        loop.close()
+    receiver.shutdown()
+    sender.shutdown()
+    received = max(connector.frames, 1)
+    return {
+        "frames": connector.frames,
+        "lost": len(frames) - connector.frames,
+        "duration": duration,
+        "cpu_us_per_frame": cpu / received * 1e6,
+        "context_switches_per_frame": (
+            (end_usage.ru_nvcsw - usage.ru_nvcsw) + (end_usage.ru_nivcsw - usage.ru_nivcsw)
+        ) / received,
+        "reports": run_metrics.reports,
+        "latency": run_metrics.latency.summary(),
+    }
+
+
+def run(vehicles, count=20000, output_tick=0.01, runtime_channel=None):
+    """
+    Benchmarks the given vehicle configurations.
+    With runtime_channel, the threaded and the asyncio runtime are compared on that channel.
+
+    Returns:
+    A JSON serializable dict with the results.
+    """
+    rng = random.Random(2)
+    values = [(rng.uniform(-300, 300), -255, 255, -1.0, 1.0) for _ in range(count)]
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "frames": count,
+            "output_tick": output_tick,
+            "time": time.time(),
+        },
+        "range_map": _statistics(_time_calls(range_map, values)),
+        "vehicles": {},
+    }
+    for vehicle in vehicles:
+        debug(f"Benchmarking {vehicle.vehicle} ...")
+        frames = synthetic_frames(vehicle, count)
+        results["vehicles"][vehicle.vehicle] = benchmark_vehicle(vehicle, frames, output_tick)
+        if runtime_channel is not None:
+            results["vehicles"][vehicle.vehicle]["runtime"] = {
+                mode: benchmark_runtime(vehicle, frames, mode == "asyncio", runtime_channel, output_tick)
+                for mode in ("threaded", "asyncio")
+            }
+    return results
+
+
+def compare(baseline, results, tolerance=0.25, minimum_us=0.5):
+    """
+    Returns a list of benchmarks whose median cost rose by more than tolerance compared to baseline.
+    Differences below minimum_us are ignored as measurement noise.
+    """
+    regressions = []
+
+    def check(name, old, new):
+        if not old.get("calls") or not new.get("calls"):
+            return
+        if new["p50_us"] > old["p50_us"] * (1.0 + tolerance) and new["p50_us"] - old["p50_us"] > minimum_us:
+            regressions.append(f"{name}: p50 {old['p50_us']:.2f} us -> {new['p50_us']:.2f} us")
+
+    check("range_map", baseline["range_map"], results["range_map"])
+    for vehicle, result in results["vehicles"].items():
+        old = baseline["vehicles"].get(vehicle)
+        if old is None:
+            continue
+        for name, statistics in result.items():
+            if name == "signals":
+                for signal, signal_statistics in statistics.items():
+                    if signal in old["signals"]:
+                        check(f"{vehicle} {signal}", old["signals"][signal], signal_statistics)
+            elif name in old:
+                check(f"{vehicle} {name}", old[name], statistics)
+    return regressions
+
+
+def start(args):
+    """
+    Benchmarks the vehicle given by args.vehicle, or all vehicles for "ALL",
+    and writes the results to args.benchmark.
+    """
+    import v2g_controller.main as main
+
+    main.load_vehicle_configurations()
+    if args.vehicle == "ALL":
+        vehicles = list(cfh.vehicle_configurations.values())
+    elif args.vehicle in cfh.vehicle_configurations:
+        vehicles = [cfh.vehicle_configurations[args.vehicle]]
+    else:
+        print("Error: Selected Vehicle is not configured!")
+        sys.exit(1)
+
+    results = run(
+        vehicles,
+        args.benchmark_frames,
+        args.output_tick if args.output_tick >= 0 else None,
+        args.benchmark_runtime,
+    )
+    with open(args.benchmark, "w") as output:
+        json.dump(results, output, indent=2)
+
+    for vehicle, result in results["vehicles"].items():
+        for mode in ("dispatch", "linear"):
+            statistics = result[f"on_message_received_{mode}"]
+            print(
+                f"{vehicle} ({mode}): {statistics['per_second']:.0f} frames/s, "
+                f"p50 {statistics['p50_us']:.1f} us, p99 {statistics['p99_us']:.1f} us"
+            )
+        for mode, statistics in result.get("runtime", {}).items():
+            latency = statistics["latency"]
+            print(
+                f"{vehicle} ({mode} runtime): {statistics['cpu_us_per_frame']:.1f} us CPU/frame, "
+                f"{statistics['context_switches_per_frame']:.3f} context switches/frame, "
+                f"{statistics['lost']} lost, report latency p50 {latency.get('p50', 0) * 1e3:.2f} ms, "
+                f"p99 {latency.get('p99', 0) * 1e3:.2f} ms"
+            )
+    print(f"Results written to {args.benchmark}")
+
+    if args.benchmark_baseline:
+        with open(args.benchmark_baseline) as baseline_file:
+            regressions = compare(json.load(baseline_file), results)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
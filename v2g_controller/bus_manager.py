@@ -0,0 +1,209 @@
+import platform
+import threading
+from collections import deque
+
+import can
+
+import v2g_controller.can_netlink as can_netlink
+from v2g_controller.helper import debug
+
+
+def init_can_bus(port, bus_type, bitrate, data_bitrate=None):
+    if platform.system() == "Linux":
+        channel_prefix = "can"
+        channel = f"{channel_prefix}{port}"
+        if bus_type == "standard":
+            debug(f"Using standard CAN bus on channel {channel}, checking interface state:" )
+            can_netlink.bring_up(channel, bitrate)
+            can_bus = can.Bus(
+                interface="socketcan",
+                channel=channel,
+                bitrate=bitrate,
+            )
+        elif bus_type == "fd":
+            debug(f"Using CAN FD bus on channel {channel}, checking interface state:" )
+            can_netlink.bring_up(channel, bitrate, data_bitrate, fd=True)
+            can_bus = can.Bus(
+                interface="socketcan",
+                channel=channel,
+                bitrate=bitrate,
+                data_bitrate=data_bitrate,
+                fd=True,
+            )
+        else:
+            debug("Invalid CAN bus type supplied for Linux")
+            return None
+    elif platform.system() == "Windows":
+        if port == 0:
+            channel = "PCAN_USBBUS1"
+        elif port == 1:
+            channel = "PCAN_USBBUS2"
+        else:
+            debug("Invalid CAN bus port supplied for Windows")
+            return None
+        if bus_type == "standard":
+            debug(f"Using standard CAN bus on channel {channel}" )
+            can_bus = can.Bus(
+                interface="pcan",
+                channel=channel,
+                bitrate=bitrate,
+            )
+        elif buy_type == "fd":
+            debug(f"Using CAN FD bus on channel {channel}" )
+            can_bus = can.Bus(
+                interface="pcan",
+                channel=channel,
+                fd=True,
+                f_clock_mhz=80,
+                nom_brp=10,
+                nom_tseg1=12,
+                nom_tseg2=3,
+                nom_sjw=3,
+                data_brp=2,
+                data_tseg1=15,
+                data_tseg2=4,
+                data_sjw=4,
+            )
+        else:
+            debug("Invalid CAN bus type supplied for Windows")
+            return None
+    else:
+        debug("Unsupported operating system")
+        return None
+    return can_bus
+
+
+class FrameBuffer(can.Listener):
+    """
+    Buffers the frames received while the vehicle is detected, until the
+    listener of the selected configuration is attached.
+    """
+
+    def __init__(self, maxlen=4096):
+        self.frames = deque(maxlen=maxlen)
+        self.target = None
+        self.lock = threading.Lock()
+
+    def on_message_received(self, msg: can.Message):
+        with self.lock:
+            if self.target is not None:
+                self.target.on_message_received(msg)
+            else:
+                self.frames.append(msg)
+
+    def attach(self, listener: can.Listener):
+        """
+        Passes the buffered frames to the listener and forwards all further frames.
+        """
+        with self.lock:
+            debug(f"Passing {len(self.frames)} frames received during detection")
+            while self.frames:
+                listener.on_message_received(self.frames.popleft())
+            self.target = listener
+
+
+class ManagedBus:
+    def __init__(self, bus, bus_type, bitrate, data_bitrate):
+        self.bus = bus
+        self.settings = (bus_type, bitrate, data_bitrate)
+        self.notifier = None
+        self.buffer = None
+
+
+class BusManager:
+    """
+    Owns the CAN buses and their notifiers.
+
+    A bus opened for vehicle detection is handed over to the selected
+    configuration if its settings match, so the interface is not reconfigured
+    and the frames received in between are not lost.
+    """
+
+    def __init__(self):
+        # port -> ManagedBus
+        self.buses = {}
+        # creates the notifier of a bus as new_notifier(bus, listeners), reader threads by default
+        self.new_notifier = can.Notifier
+
+    def open(self, port, bus_type, bitrate, data_bitrate=None) -> can.BusABC:
+        """
+        Returns the bus of the port, reusing an open bus with the same settings.
+        """
+        managed = self.buses.get(port)
+        if managed is not None:
+            if managed.settings == (bus_type, bitrate, data_bitrate):
+                debug(f"Reusing CAN bus {port}")
+                return managed.bus
+            self.close(port)
+        bus = init_can_bus(port, bus_type, bitrate, data_bitrate)
+        if bus is not None:
+            self.buses[port] = ManagedBus(bus, bus_type, bitrate, data_bitrate)
+        return bus
+
+    def buffer(self, port):
+        """
+        Buffers the frames of the port until listeners are attached by listen().
+        """
+        managed = self.buses[port]
+        managed.buffer = FrameBuffer()
+        self.notifier(port).add_listener(managed.buffer)
+
+    def notifier(self, port) -> can.Notifier:
+        managed = self.buses[port]
+        if managed.notifier is None:
+            managed.notifier = self.new_notifier(managed.bus, [])
+        return managed.notifier
+
+    def attach_loop(self, loop):
+        """
+        Calls the listeners from an asyncio event loop instead of reader threads.
+        Notifiers created before, e.g. for the detection, are moved to the loop.
+        """
+        self._replace_notifiers(lambda bus, listeners: can.Notifier(bus, listeners, loop=loop))
+
+    def attach_glib(self, metrics=None):
+        """
+        Calls the listeners from the GLib main loop instead of reader threads (Bluetooth mode).
+        Notifiers created before, e.g. for the detection, are moved to the main loop.
+        """
+        from v2g_controller.glib_runtime import GLibNotifier
+
+        self._replace_notifiers(lambda bus, listeners: GLibNotifier(bus, listeners, metrics))
+
+    def _replace_notifiers(self, new_notifier):
+        self.new_notifier = new_notifier
+        for managed in self.buses.values():
+            if managed.notifier is not None:
+                listeners = managed.notifier.listeners
+                # unread frames stay in the receive queue of the bus
+                managed.notifier.stop()
+                managed.notifier = new_notifier(managed.bus, listeners)
+
+    def listen(self, port, listeners):
+        """
+        Adds listeners to the notifier of the port. If frames were buffered,
+        they are passed to the first listener, which replaces the buffer.
+        """
+        managed = self.buses[port]
+        notifier = self.notifier(port)
+        if managed.buffer is not None:
+            listeners = list(listeners)
+            first = listeners.pop(0)
+            managed.buffer.attach(first)
+            # replace the buffer in place, the notifier calls either of them
+            notifier.listeners[notifier.listeners.index(managed.buffer)] = first
+            managed.buffer = None
+        for listener in listeners:
+            notifier.add_listener(listener)
+
+    def close(self, port):
+        managed = self.buses.pop(port, None)
+        if managed is None:
+            return
+        if managed.notifier is not None:
+            managed.notifier.stop()
+        managed.bus.shutdown()
+
+    def shutdown(self):
+        for port in list(self.buses):
+            self.close(port)
@@ -0,0 +1,124 @@
+from v2g_controller.helper import debug
+
+STANDARD_MASK = 0x7FF
+EXTENDED_MASK = 0x1FFFFFFF
+
+
+def _accepted(mask, full_mask):
+    """
+    Returns the number of IDs accepted by a filter with the given mask.
+    """
+    return 1 << (bin(full_mask).count("1") - bin(mask & full_mask).count("1"))
+
+
+def _merge(groups, max_filters):
+    """
+    Merges (can_id, can_mask, full_mask) groups until at most max_filters are left.
+    Always merges the two groups whose combined filter accepts the fewest IDs.
+    Standard and extended IDs are never merged.
+    """
+    groups = list(groups)
+    while len(groups) > max_filters:
+        best = None
+        for i in range(len(groups)):
+            for j in range(i + 1, len(groups)):
+                (id_a, mask_a, full_mask), (id_b, mask_b, full_mask_b) = groups[i], groups[j]
+                if full_mask != full_mask_b:
+                    continue
+                mask = mask_a & mask_b & ~(id_a ^ id_b) & full_mask
+                accepted = _accepted(mask, full_mask)
+                if best is None or accepted < best[0]:
+                    best = (accepted, i, j, (id_a & mask, mask, full_mask))
+        if best is None:
+            break
+        _, i, j, merged = best
+        groups[i] = merged
+        del groups[j]
+    return groups
+
+
+def compile_filters(can_ids, max_filters=None, extended_ids=()):
+    """
+    Returns the python-can filters accepting the given IDs.
+
+    Every ID gets an exact filter. If there are more IDs than max_filters,
+    IDs with similar bits are merged into mask groups, which then accept
+    additional IDs that have to be dropped in user space.
+
+    Args:
+    can_ids: The CAN IDs, IDs above 0x7FF are treated as extended IDs.
+    max_filters: Number of filters supported by the interface or None for unlimited.
+    extended_ids: IDs up to 0x7FF that are extended IDs as well.
+    """
+    groups = []
+    for can_id in sorted(set(can_ids)):
+        mask = STANDARD_MASK if can_id <= STANDARD_MASK and can_id not in extended_ids else EXTENDED_MASK
+        groups.append((can_id, mask, mask))
+    if max_filters is not None:
+        groups = _merge(groups, max_filters)
+    return [
+        {"can_id": can_id, "can_mask": mask, "extended": full_mask == EXTENDED_MASK}
+        for can_id, mask, full_mask in groups
+    ]
+
+
+def accepted_ids(filters):
+    """
+    Returns the number of IDs accepted by the filters (overlapping groups are counted twice).
+    """
+    return sum(
+        _accepted(entry["can_mask"], EXTENDED_MASK if entry["extended"] else STANDARD_MASK) for entry in filters
+    )
+
+
+def bus_ids(vehicle_configuration):
+    """
+    Returns the IDs received per bus, as list with one sorted list of IDs per bus.
+    Signals without a bus are received on all buses.
+    """
+    ids = [set() for _ in vehicle_configuration.can_buses]
+    for config in vehicle_configuration.configurations:
+        if config.bus is None:
+            for bus_ids in ids:
+                bus_ids.add(config.can_signal.id)
+        elif config.bus < len(ids):
+            ids[config.bus].add(config.can_signal.id)
+        else:
+            print(f"Error: Signal {config.name} uses bus {config.bus}, but only {len(ids)} buses are configured!")
+            exit(-1)
+    return [sorted(bus_ids) for bus_ids in ids]
+
+
+def extended_ids(vehicle_configuration):
+    """
+    Returns the set of IDs whose signals are flagged as extended IDs.
+    """
+    return {
+        config.can_signal.id
+        for config in vehicle_configuration.configurations
+        if config.can_signal.is_extended_id
+    }
+
+
+def bus_filters(vehicle_configuration, extra_ids=None):
+    """
+    Returns the minimal filters per bus for a vehicle configuration.
+
+    Args:
+    vehicle_configuration: The vehicle configuration.
+    extra_ids: Optional dict of bus index -> additional IDs to receive.
+    """
+    filters = []
+    extended = extended_ids(vehicle_configuration)
+    for index, (bus, can_ids) in enumerate(zip(vehicle_configuration.can_buses, bus_ids(vehicle_configuration))):
+        if extra_ids and index in extra_ids:
+            can_ids = sorted(set(can_ids) | set(extra_ids[index]))
+        bus_filter = compile_filters(can_ids, bus.max_filters, extended)
+        if bus.max_filters is not None and len(can_ids) > bus.max_filters:
+            print(
+                f"Warning: Bus {index} requires {len(can_ids)} filters, but the interface offloads only "
+                f"{bus.max_filters}. Merged into mask groups accepting {accepted_ids(bus_filter)} IDs."
+            )
+        debug(f"Filters for bus {index}: {[hex(can_id) for can_id in can_ids]}")
+        filters.append(bus_filter)
+    return filters
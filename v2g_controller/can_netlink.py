@@ -0,0 +1,214 @@
+import errno
+import os
+import socket
+import struct
+import subprocess
+from collections import namedtuple
+
+from v2g_controller.helper import debug
+
+# linux/netlink.h, linux/rtnetlink.h, linux/if_link.h, linux/can/netlink.h
+NETLINK_ROUTE = 0
+NLMSG_ERROR = 2
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+IFF_UP = 0x1
+IFLA_LINKINFO = 18
+IFLA_INFO_KIND = 1
+IFLA_INFO_DATA = 2
+IFLA_CAN_BITTIMING = 1
+IFLA_CAN_CTRLMODE = 5
+IFLA_CAN_DATA_BITTIMING = 9
+CAN_CTRLMODE_FD = 0x20
+NLA_TYPE_MASK = 0x3FFF
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_IFINFOMSG = struct.Struct("=BxHiII")
+_RTATTR = struct.Struct("=HH")
+# struct can_bittiming, only the bitrate is set, the kernel calculates the rest
+_BITTIMING = struct.Struct("=IIIIIIII")
+_CTRLMODE = struct.Struct("=II")
+
+LinkState = namedtuple("LinkState", ["up", "kind", "bitrate", "data_bitrate", "fd"])
+LinkState.__doc__ = "State of a network interface, bitrates are None if not available (e.g. vcan)."
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _attribute(type, payload):
+    length = _RTATTR.size + len(payload)
+    return _RTATTR.pack(length, type) + payload + b"\0" * (_align(length) - length)
+
+
+def _attributes(data):
+    """
+    Returns the attributes of a netlink payload as dict of type -> payload.
+    """
+    attributes = {}
+    offset = 0
+    while offset + _RTATTR.size <= len(data):
+        length, type = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attributes[type & NLA_TYPE_MASK] = data[offset + _RTATTR.size : offset + length]
+        offset += _align(length)
+    return attributes
+
+
+def _request(message_type, flags, ifinfo, attributes=b""):
+    """
+    Sends a rtnetlink request and returns the payloads of the replies.
+    Raises OSError for netlink errors, e.g. EPERM without CAP_NET_ADMIN.
+    """
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+        sock.bind((0, 0))
+        payload = ifinfo + attributes
+        sock.send(_NLMSGHDR.pack(_NLMSGHDR.size + len(payload), message_type, NLM_F_REQUEST | flags, 1, 0) + payload)
+        replies = []
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, reply_type, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+                body = data[offset + _NLMSGHDR.size : offset + length]
+                offset += _align(length)
+                if reply_type == NLMSG_ERROR:
+                    error = -struct.unpack_from("=i", body)[0]
+                    if error != 0:
+                        raise OSError(error, os.strerror(error))
+                    # acknowledgement
+                    return replies
+                replies.append(body)
+            if not flags & NLM_F_ACK:
+                return replies
+
+
+def read_state(ifname) -> LinkState:
+    """
+    Reads the state and CAN bit timing of an interface via rtnetlink.
+    """
+    index = socket.if_nametoindex(ifname)
+    reply = _request(RTM_GETLINK, 0, _IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, 0, 0))[0]
+    _, _, _, flags, _ = _IFINFOMSG.unpack_from(reply)
+    attributes = _attributes(reply[_IFINFOMSG.size :])
+    kind = None
+    bitrate = None
+    data_bitrate = None
+    fd = False
+    if IFLA_LINKINFO in attributes:
+        linkinfo = _attributes(attributes[IFLA_LINKINFO])
+        kind = linkinfo.get(IFLA_INFO_KIND, b"").rstrip(b"\0").decode() or None
+        data = _attributes(linkinfo.get(IFLA_INFO_DATA, b""))
+        if IFLA_CAN_BITTIMING in data:
+            bitrate = _BITTIMING.unpack_from(data[IFLA_CAN_BITTIMING])[0]
+        if IFLA_CAN_DATA_BITTIMING in data:
+            data_bitrate = _BITTIMING.unpack_from(data[IFLA_CAN_DATA_BITTIMING])[0]
+        if IFLA_CAN_CTRLMODE in data:
+            fd = bool(_CTRLMODE.unpack_from(data[IFLA_CAN_CTRLMODE])[1] & CAN_CTRLMODE_FD)
+    return LinkState(bool(flags & IFF_UP), kind, bitrate, data_bitrate, fd)
+
+
+def set_link(ifname, up, bitrate=None, data_bitrate=None, fd=False):
+    """
+    Sets the interface up or down and, if bitrate is given, configures the CAN bit timing,
+    like "ip link set <ifname> up type can bitrate <bitrate> [fd on dbitrate <data_bitrate>]".
+    """
+    index = socket.if_nametoindex(ifname)
+    ifinfo = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, IFF_UP if up else 0, IFF_UP)
+    attributes = b""
+    if bitrate is not None:
+        data = _attribute(IFLA_CAN_BITTIMING, _BITTIMING.pack(bitrate, 0, 0, 0, 0, 0, 0, 0))
+        data += _attribute(IFLA_CAN_CTRLMODE, _CTRLMODE.pack(CAN_CTRLMODE_FD, CAN_CTRLMODE_FD if fd else 0))
+        if fd:
+            data += _attribute(IFLA_CAN_DATA_BITTIMING, _BITTIMING.pack(data_bitrate, 0, 0, 0, 0, 0, 0, 0))
+        attributes = _attribute(
+            IFLA_LINKINFO,
+            _attribute(IFLA_INFO_KIND, b"can") + _attribute(IFLA_INFO_DATA, data),
+        )
+    _request(RTM_NEWLINK, NLM_F_ACK, ifinfo, attributes)
+
+
+def is_up(ifname):
+    """
+    Reads the administrative state of an interface from sysfs.
+    """
+    with open(f"/sys/class/net/{ifname}/flags") as flags:
+        return bool(int(flags.read(), 16) & IFF_UP)
+
+
+def _matches(state: LinkState, bitrate, data_bitrate, fd):
+    if state.kind != "can":
+        # e.g. vcan, no bit timing
+        return True
+    return state.bitrate == bitrate and state.fd == fd and (not fd or state.data_bitrate == data_bitrate)
+
+
+def _ip_link(ifname, bitrate, data_bitrate, fd):
+    command = ["sudo", "ip", "link", "set", ifname, "up", "type", "can", "bitrate", f"{bitrate}"]
+    if fd:
+        command += ["fd", "on", "dbitrate", f"{data_bitrate}"]
+    subprocess.run(["sudo", "ip", "link", "set", ifname, "down"], check=False)
+    subprocess.run(command, check=False)
+
+
+def bring_up(ifname, bitrate, data_bitrate=None, fd=False):
+    """
+    Brings a CAN interface up with the given bit timing.
+
+    Nothing is done if the interface is already up with the right settings.
+    The interface is configured via rtnetlink, which requires CAP_NET_ADMIN;
+    without it, "sudo ip link" is used instead. The resulting settings are verified.
+
+    Returns:
+    True if the interface is up with the requested settings.
+    """
+    try:
+        state = read_state(ifname)
+    except OSError as error:
+        # no netlink available, fall back to sysfs
+        debug(f"Could not read the state of {ifname} via netlink: {error}")
+        state = None
+        try:
+            if is_up(ifname):
+                debug(f"{ifname} is up, bit timing unknown")
+                return True
+        except OSError:
+            pass
+
+    if state is not None:
+        if state.up and _matches(state, bitrate, data_bitrate, fd):
+            debug(f"{ifname} is up with the configured bit timing")
+            return True
+        debug(f"{ifname} is {'up with a different bit timing' if state.up else 'down'}, configuring")
+        configure = state.kind == "can"
+        try:
+            if state.up:
+                set_link(ifname, False)
+            if configure:
+                set_link(ifname, True, bitrate, data_bitrate, fd)
+            else:
+                set_link(ifname, True)
+        except OSError as error:
+            if error.errno not in (errno.EPERM, errno.EACCES):
+                print(f"Error: Could not configure {ifname}: {error}")
+                return False
+            debug(f"No permission to configure {ifname}, using sudo ip link")
+            _ip_link(ifname, bitrate, data_bitrate, fd)
+    else:
+        _ip_link(ifname, bitrate, data_bitrate, fd)
+
+    try:
+        state = read_state(ifname)
+    except OSError:
+        return True
+    if not state.up or not _matches(state, bitrate, data_bitrate, fd):
+        print(
+            f"Error: {ifname} is {'up' if state.up else 'down'} with bitrate {state.bitrate}, "
+            f"data bitrate {state.data_bitrate}, expected {bitrate}, {data_bitrate}"
+        )
+        return False
+    return True
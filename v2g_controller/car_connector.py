@@ -1,9 +1,13 @@
 import can
+import threading
+import time
 
-from v2g_controller.helper import debug, range_map
+from v2g_controller.helper import range_map
 import v2g_controller.configuration_helper as cfh
-from v2g_controller.gamepads.mygamepad.mygamepad import MyGamepad
+from v2g_controller.dispatch import DispatchTable
+from v2g_controller.rate_limiter import SignalRateLimiter
 from v2g_controller.gamepads.abstract_gamepad import Buttons
+from v2g_controller.gamepads.report_aggregator import ReportAggregator
 
 
 class CarConnector(can.Listener):
@@ -11,14 +15,41 @@ class CarConnector(can.Listener):
     Class for converting CAN signals into a virtual gamepad.
     """
 
-    def __init__(self, gamepad, vehicle_config: cfh.VehicleConfiguration):
+    def __init__(
+        self,
+        gamepad,
+        vehicle_config: cfh.VehicleConfiguration,
+        linear_dispatch=False,
+        output_tick=None,
+        metrics=None,
+    ):
         """
         Initialize the virtual gamepad and variables.
+
+        Args:
+        gamepad: The gamepad to update, a MyGamepad is created if None.
+        vehicle_config: The configuration of the connected vehicle.
+        linear_dispatch: Match every frame against all configurations in order
+                         instead of using the precompiled dispatch table.
+        output_tick: If set, gamepad updates are coalesced and sent at most once
+                     per output_tick seconds, and only if the report changed.
+        metrics: Metrics object to record frame counts and decode times, or None.
         """
         if gamepad is None:
-            self.gamepad = MyGamepad()
-        else:
+            # imported here, vgamepad is not required for other gamepads
+            from v2g_controller.gamepads.mygamepad.mygamepad import MyGamepad
+            gamepad = MyGamepad()
+        if output_tick is None:
+            self.aggregator = None
             self.gamepad = gamepad
+        else:
+            self.aggregator = ReportAggregator(gamepad, output_tick)
+            self.gamepad = self.aggregator
+        # flush the aggregator after each frame, disabled when an output thread owns the gamepad
+        self.flush_inline = True
+        self.metrics = metrics
+        if self.aggregator is not None:
+            self.aggregator.metrics = metrics
         self.x_axis = 0.0
         self.y_axis = 0.0
         self.direction = 1
@@ -32,6 +63,28 @@ class CarConnector(can.Listener):
         }
         self.vehicle = vehicle_config
         self.counter = 0
+        self.frames = 0
+        self._status_sample = (time.monotonic(), 0, 0)
+        self.dispatch = None if linear_dispatch else DispatchTable(vehicle_config.configurations)
+        # (response ID, DID) -> configurations decoded from reassembled UDS responses
+        self.uds_dispatch = {}
+        for config in vehicle_config.configurations:
+            if config.did is not None:
+                key = (config.can_signal.id, config.did)
+                self.uds_dispatch[key] = self.uds_dispatch.get(key, ()) + (config,)
+        # response IDs whose frames are decoded after reassembly, not dropped by the filter
+        self.uds_ids = {response_id for response_id, _ in self.uds_dispatch}
+        self.limiters = {}
+        for config in vehicle_config.configurations:
+            max_rate = config.max_rate if config.max_rate is not None else vehicle_config.max_rate
+            if max_rate:
+                self.limiters[config] = SignalRateLimiter(config, max_rate)
+        self.pending_limiters = set()
+        # called with the time at which a value held back by a rate limiter is due,
+        # e.g. by an output to schedule apply_pending() when no further frame arrives
+        self.on_pending = None
+        # serializes decoding with apply_pending() called from an output thread
+        self.lock = threading.Lock()
 
     def on_message_received(self, msg: can.Message):
         """
@@ -41,14 +94,164 @@ class CarConnector(can.Listener):
         msg: The CAN message received.
         """
         
+        self.frames += 1
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.frame(msg)
+
         if self.counter < self.vehicle.read_limiter:
             self.counter +=1
+            if metrics is not None:
+                metrics.drop("read_limiter")
             return
         else:
             self.counter = 0
 
+        now = msg.timestamp or time.time()
+        if self.dispatch is None:
+            configs = self._match_linear(msg)
+        else:
+            configs = self.dispatch.lookup(msg.arbitration_id, msg.data)
+
+        with self.lock:
+            if self.aggregator is not None:
+                self.aggregator.source_time = msg.timestamp or None
+            if self.pending_limiters:
+                configs = tuple(configs)
+                self._apply_pending(now, configs)
+            matched = self._decode(configs, msg.data, now)
+        if not matched and metrics is not None and msg.arbitration_id not in self.uds_ids:
+            metrics.drop("filter")
+        if self.aggregator is not None and self.flush_inline:
+            self.aggregator.maybe_flush(now)
+
+    def on_uds_response(self, response_id, did, data, msg: can.Message):
+        """
+        Decodes the signals configured for the data of a DID in a reassembled UDS response.
+
+        Args:
+        response_id: CAN ID of the response.
+        did: Data identifier.
+        data: Data of the DID, without the DID itself. Only valid during the call.
+        msg: The last CAN frame of the response.
+        """
+        configs = self.uds_dispatch.get((response_id, did))
+        if configs is None:
+            return
+        now = msg.timestamp or time.time()
+        with self.lock:
+            if self.aggregator is not None:
+                self.aggregator.source_time = msg.timestamp or None
+            if self.pending_limiters:
+                self._apply_pending(now, configs)
+            self._decode(configs, data, now)
+        if self.aggregator is not None and self.flush_inline:
+            self.aggregator.maybe_flush(now)
+
+    def on_pdu(self, response_id, payload, msg: can.Message):
+        """
+        Decodes a reassembled UDS response holding a single DID, e.g. from an isotp.IsoTpListener.
+        """
+        if len(payload) >= 3 and payload[0] == 0x62:
+            self.on_uds_response(response_id, (payload[1] << 8) | payload[2], payload[3:], msg)
+
+    def _decode(self, configs, payload, now):
+        """
+        Applies the configurations to a payload, subject to their rate limiters.
+
+        Returns:
+        True if any configuration matched.
+        """
+        metrics = self.metrics
+        matched = False
+        for config in configs:
+            matched = True
+            limiter = self.limiters.get(config)
+            if limiter is not None and not limiter.admit(payload, now):
+                if limiter.pending is not None and limiter not in self.pending_limiters:
+                    self.pending_limiters.add(limiter)
+                    if self.on_pending is not None:
+                        self.on_pending(limiter.next_time)
+                if metrics is not None:
+                    metrics.drop("rate_limit")
+                continue
+            if metrics is None:
+                self._apply(config, payload)
+            else:
+                start = time.perf_counter()
+                self._apply(config, payload)
+                metrics.decoded(config.name, time.perf_counter() - start)
+        return matched
+
+    def status(self):
+        """
+        Returns the current gamepad state and the frame and report rates since the last call.
+        """
+        now = time.monotonic()
+        reports = self.aggregator.reports if self.aggregator is not None else 0
+        last_time, last_frames, last_reports = self._status_sample
+        self._status_sample = (now, self.frames, reports)
+        elapsed = now - last_time
+        frame_rate = (self.frames - last_frames) / elapsed if elapsed > 0 else 0.0
+        report_rate = (reports - last_reports) / elapsed if elapsed > 0 else 0.0
+        status = (
+            f"X: {self.x_axis:6.3f}, Y: {self.y_axis:6.3f}, direction: {self.direction:2d}, Brake: {self.brake:5.3f}, Gear: {self.last_gear:2d}, "
+            f"A: {self.buttons[Buttons.A]}, B: {self.buttons[Buttons.B]}, X: {self.buttons[Buttons.X]}, Y: {self.buttons[Buttons.Y]}, "
+            f"{frame_rate:6.0f} frames/s"
+        )
+        if self.aggregator is not None:
+            status += f", {report_rate:4.0f} reports/s"
+        return status + "   "
+
+    def _apply_pending(self, now, configs=()):
+        """
+        Applies the latest frames held back by rate limiters whose interval has passed.
+
+        Args:
+        now: Current time in seconds.
+        configs: Configurations matching the frame being decoded, their held back
+                 frames are dropped, the newer frame is passed to their limiters instead.
+        """
+        for config in configs:
+            limiter = self.limiters.get(config)
+            if limiter is not None and limiter in self.pending_limiters:
+                limiter.pending = None
+                self.pending_limiters.discard(limiter)
+        metrics = self.metrics
+        for limiter in list(self.pending_limiters):
+            payload = limiter.take_due(now)
+            if payload is not None and metrics is None:
+                self._apply(limiter.config, payload)
+            elif payload is not None:
+                start = time.perf_counter()
+                self._apply(limiter.config, payload)
+                metrics.decoded(limiter.config.name, time.perf_counter() - start)
+            if limiter.pending is None:
+                self.pending_limiters.discard(limiter)
+
+    def apply_pending(self, now=None):
+        """
+        Applies the values held back by rate limiters that are due, without waiting for the next frame.
+        Called by the outputs, on_pending is called again for the values that are still held back.
+
+        Args:
+        now: Current time in seconds, in the clock of the frame timestamps, time.time() if None.
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            if self.aggregator is not None:
+                self.aggregator.source_time = None
+            self._apply_pending(now)
+            if self.pending_limiters and self.on_pending is not None:
+                self.on_pending(min(limiter.next_time for limiter in self.pending_limiters))
+
+    def _match_linear(self, msg: can.Message):
+        """
+        Yields the configurations matching the message by checking all of them in order.
+        """
         for config in self.vehicle.configurations:
-            if config.match(msg.arbitration_id):
+            if config.did is None and config.match(msg.arbitration_id):
                 # apply UDS identity filter
                 if config.ident_filter != []:
                     ident_pos = 2 if config.ident_filter_mf == False else 3
@@ -60,51 +263,53 @@ class CarConnector(can.Listener):
                 if config.cf_filter != []:
                     if config.cf_filter[0] != msg.data[0]:
                             continue
-                    
-                if config.type == cfh.Type.Steering:
-                    self.x_axis = self.steering_map(
-                        config.value(msg.data),
-                        self.vehicle.steering_exponent,
-                        -self.vehicle.steering_max,
-                        self.vehicle.steering_max,
-                        self.vehicle.steering_deadzone,
-                    )
-                    self.gamepad.update_js_left(self.x_axis, self.y_axis)
-                elif config.type == cfh.Type.Speed:
-                    self.y_axis = (
-                        self.speed_map(config.value(msg.data)) * self.direction
-                    )
-                    self.gamepad.update_js_left(self.x_axis, self.y_axis)
-                elif config.type == cfh.Type.Brake:
-                    self.brake = self.brake_map(config.value(msg.data))
-                    self.gamepad.update_tg_left(self.brake)
-                elif config.type == cfh.Type.Button:
-                    value = config.value(msg.data)
-                    if self.buttons[config.buttons[0]] != value:
-                        self.buttons[config.buttons[0]] = value
-                        self.gamepad.update_button(config.buttons[0], value)
-                elif config.type == cfh.Type.Gear:
-                    if config.value(msg.data) == -2:
-                        self.direction = -1
-                    elif config.value(msg.data) == -1:
-                        if self.last_gear != -1:
-                            self.gamepad.update_button(config.buttons[0], 1)
-                            self.last_gear = -1
-                    elif config.value(msg.data) == 0:
-                        if self.last_gear == -1:
-                            self.gamepad.update_button(config.buttons[0], 0)
-                        elif self.last_gear == 1:
-                            self.gamepad.update_button(config.buttons[1], 0)
-                        self.last_gear = 0
-                    elif config.value(msg.data) == 1:
-                        if self.last_gear != 1:
-                            self.gamepad.update_button(config.buttons[1], 1)
-                            self.last_gear = 1
-                            self.direction = 1
-        debug(
-            f"X: {self.x_axis:6.3f}, Y: {self.y_axis:6.3f}, direction: {self.direction:2d}, Brake: {self.brake:5.3f}, Gear: {self.last_gear:2d}, A: {self.buttons[Buttons.A]}, B: {self.buttons[Buttons.B]}, X: {self.buttons[Buttons.X]}, Y: {self.buttons[Buttons.Y]}   ",
-            overwrite=True,
-        )
+                yield config
+
+    def _apply(self, config: cfh.SignalConfiguration, payload):
+        """
+        Decodes a signal from the payload and updates the gamepad state.
+        """
+        if config.type == cfh.Type.Steering:
+            self.x_axis = self.steering_map(
+                config.value(payload),
+                self.vehicle.steering_exponent,
+                -self.vehicle.steering_max,
+                self.vehicle.steering_max,
+                self.vehicle.steering_deadzone,
+            )
+            self.gamepad.update_js_left(self.x_axis, self.y_axis)
+        elif config.type == cfh.Type.Speed:
+            self.y_axis = (
+                self.speed_map(config.value(payload)) * self.direction
+            )
+            self.gamepad.update_js_left(self.x_axis, self.y_axis)
+        elif config.type == cfh.Type.Brake:
+            self.brake = self.brake_map(config.value(payload))
+            self.gamepad.update_tg_left(self.brake)
+        elif config.type == cfh.Type.Button:
+            value = config.value(payload)
+            if self.buttons[config.buttons[0]] != value:
+                self.buttons[config.buttons[0]] = value
+                self.gamepad.update_button(config.buttons[0], value)
+        elif config.type == cfh.Type.Gear:
+            gear = config.value(payload)
+            if gear == -2:
+                self.direction = -1
+            elif gear == -1:
+                if self.last_gear != -1:
+                    self.gamepad.update_button(config.buttons[0], 1)
+                    self.last_gear = -1
+            elif gear == 0:
+                if self.last_gear == -1:
+                    self.gamepad.update_button(config.buttons[0], 0)
+                elif self.last_gear == 1:
+                    self.gamepad.update_button(config.buttons[1], 0)
+                self.last_gear = 0
+            elif gear == 1:
+                if self.last_gear != 1:
+                    self.gamepad.update_button(config.buttons[1], 1)
+                    self.last_gear = 1
+                    self.direction = 1
 
     def steering_map(self, angle_in, exponent, in_min, in_max, deadzone) -> float:
         #debug(f"input angel: {angle_in}")
@@ -1,71 +1,158 @@
 import can
-import v2g_controller.main as main
 from v2g_controller.helper import debug
-from v2g_controller.configuration_helper import vehicle_configurations
 from v2g_controller.configuration_helper import OperationMode
-import time
-import v2g_controller.vehicle_configurations.configuration_id3 as id3
+import v2g_controller.vehicle_manifest as vehicle_manifest
+from v2g_controller.bus_manager import BusManager
+import threading
 
+class CarDetector(can.Listener):
+    """
+    Incremental vehicle detection.
 
-import v2g_controller.configuration_helper as cfh
+    Every received ID updates the score (number of distinct auto-detect IDs
+    seen) of the candidate vehicles using it, found through an inverted index
+    from ID to vehicles. A vehicle is confirmed as soon as all of its
+    auto-detect IDs were seen and no other candidate is within the confidence
+    margin, so detection finishes after a handful of frames instead of a
+    fixed time.
+    """
 
-class CarDetector(can.Listener):
-    def __init__(self):
+    def __init__(self, operation_mode: OperationMode, margin=0.5):
+        """
+        Args:
+        operation_mode: Only vehicles of this mode are candidates.
+        margin: A complete match is confirmed immediately if every other
+                candidate has seen less than 1 - margin of its IDs.
+        """
         self.vehicle = "NONE"
-        self.tesla_ctr = 0
-        self.can_ids = dict[int:bool]()
+        self.operation_mode = operation_mode
+        self.margin = margin
+        self.detected = threading.Event()
+        # CAN ID -> candidate vehicles
+        self.index = {}
+        # vehicle -> number of auto-detect IDs
+        self.required = {}
+        # vehicle -> number of auto-detect IDs seen
+        self.scores = {}
+        self.seen = set()
+        for manifest in vehicle_manifest.manifests().values():
+            if not manifest.operation_mode == operation_mode or len(manifest.auto_detect_ids) < 1:
+                continue
+            self.required[manifest.vehicle] = len(set(manifest.auto_detect_ids))
+            self.scores[manifest.vehicle] = 0
+            for can_id in set(manifest.auto_detect_ids):
+                self.index.setdefault(can_id, []).append(manifest.vehicle)
 
     def on_message_received(self, msg: can.Message):
-        self.can_ids[msg.arbitration_id] = True
-        
-            
-    def get_vehicle(self, operation_mode):
-        if self.vehicle == "NONE":
-            for vehicle in vehicle_configurations:
-                if not vehicle_configurations[vehicle].operation_mode == operation_mode:
-                    continue
-                if vehicle_configurations[vehicle].auto_detect_ids.__len__() < 1:
-                    continue
-                debug(f"Vehicle: {vehicle_configurations[vehicle].vehicle}")
-                match = True  
-                for key in vehicle_configurations[vehicle].auto_detect_ids:
-                    if not key in self.can_ids:
-                        debug(f"Key {hex(key)} not found in can_ids for vehicle {vehicle}")
-                        match = False
-                if match:
+        can_id = msg.arbitration_id
+        if can_id in self.seen:
+            return
+        candidates = self.index.get(can_id)
+        if candidates is None:
+            return
+        self.seen.add(can_id)
+        scores = self.scores
+        for vehicle in candidates:
+            scores[vehicle] += 1
+        for vehicle in candidates:
+            if scores[vehicle] == self.required[vehicle] and self._confident(vehicle):
+                self.vehicle = vehicle
+                self.detected.set()
+                return
+
+    def _confident(self, vehicle):
+        limit = 1.0 - self.margin
+        for other, score in self.scores.items():
+            if other != vehicle and score / self.required[other] > limit:
+                return False
+        return True
+
+    def ranking(self):
+        """
+        Returns the candidates as list of (vehicle, IDs seen, IDs required),
+        best match first. Among complete matches, vehicles with more IDs rank first.
+        """
+        return sorted(
+            ((vehicle, self.scores[vehicle], self.required[vehicle]) for vehicle in self.scores),
+            key=lambda candidate: (candidate[1] / candidate[2], candidate[2]),
+            reverse=True,
+        )
+
+    def wait(self, timeout):
+        """
+        Waits until a vehicle is confirmed or the timeout has passed.
+
+        Returns:
+        The confirmed vehicle, the best complete match after the timeout, or "NONE".
+        """
+        if not self.detected.wait(timeout):
+            for vehicle, score, required in self.ranking():
+                if score == required:
                     self.vehicle = vehicle
-                    return self.vehicle
-                
+                break
         return self.vehicle
-    
+
     def polling_messages(self):
+        # the configurations of UDS vehicles are only loaded if passive detection failed
         polling_messages = []
-        for vehicle in vehicle_configurations:
-            if not vehicle_configurations[vehicle].operation_mode == OperationMode.UDS:
+        for manifest in vehicle_manifest.manifests().values():
+            if not manifest.operation_mode == OperationMode.UDS:
                 continue
-            polling_messages.extend(vehicle_configurations[vehicle].polling_messages)
+            polling_messages.extend(manifest.load().polling_messages)
         return polling_messages
 
 
+def _debug_ranking(detector: CarDetector):
+    for vehicle, score, required in detector.ranking():
+        debug(f" - {vehicle}: {score}/{required} IDs")
 
-def detect_vehicle():
+
+def detect_vehicle(bus_manager=None, observed=None):
+    """
+    Detects the vehicle on bus 0.
+
+    Args:
+    bus_manager: If given, the detection bus is left open and its frames are
+                 buffered, so the bus can be reused for the detected vehicle.
+    observed: If given, the auto-detect IDs of all candidates that were
+              received during the detection are added to this set.
+    """
     debug("Trying to automatically detect the vehicle...")    
-    detector = CarDetector()
-    with main.init_can_bus(0, "standard", 500000) as bus:
-            notifier = can.Notifier(bus, [detector])
-            time.sleep(1)
-            if detector.get_vehicle(OperationMode.Internal) == "NONE":
-                debug("No vehicle detected for internal mode, trying UDS mode")
-                
-                try: 
-                    for msg in detector.polling_messages():
-                        bus.send(msg.message)
-                except can.CanOperationError as error:
-                    debug("Auto-detection via UDS failed!")
-                    debug(error)
-                time.sleep(0.5)
-                detector.get_vehicle(OperationMode.UDS)
-            notifier.stop()
+    detector = CarDetector(OperationMode.Internal)
+    if bus_manager is None:
+        bus_manager = BusManager()
+        keep_bus = False
+    else:
+        keep_bus = True
+    bus = bus_manager.open(0, "standard", 500000)
+    if keep_bus:
+        bus_manager.buffer(0)
+    notifier = bus_manager.notifier(0)
+    notifier.add_listener(detector)
+    if detector.wait(1.0) == "NONE":
+        debug("No vehicle detected for internal mode, candidates:")
+        _debug_ranking(detector)
+        debug("Trying UDS mode")
+        notifier.remove_listener(detector)
+        if observed is not None:
+            observed.update(detector.seen)
+        detector = CarDetector(OperationMode.UDS)
+        notifier.add_listener(detector)
+
+        try: 
+            for msg in detector.polling_messages():
+                bus.send(msg.message)
+        except can.CanOperationError as error:
+            debug("Auto-detection via UDS failed!")
+            debug(error)
+        if detector.wait(0.5) == "NONE":
+            debug("No vehicle detected for UDS mode, candidates:")
+            _debug_ranking(detector)
+    notifier.remove_listener(detector)
+    if observed is not None:
+        observed.update(detector.seen)
+    if not keep_bus:
+        bus_manager.close(0)
     
     debug(f"Detected vehicle: {detector.vehicle}")
     return detector.vehicle
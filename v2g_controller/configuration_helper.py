@@ -1,4 +1,7 @@
+import os
 from enum import Enum
+from operator import itemgetter
+from struct import Struct
 from v2g_controller.helper import debug
 from can import Message
 
@@ -15,11 +18,22 @@ class Type(Enum):
     Gear = 3
     Button = 4
 
+
+class RatePolicy(Enum):
+    # Frames arriving faster than max_rate are dropped, the latest dropped
+    # frame is applied once the interval has passed
+    Latest = 0
+    # Like Latest, but frames changing the signal bytes are never dropped
+    Edges = 1
+
 class CANBus():
-    def __init__(self, type, bitrate, data_bitrate=None):
+    def __init__(self, type, bitrate, data_bitrate=None, max_filters=None):
         self.type = type
         self.bitrate = bitrate
         self.data_bitrate = data_bitrate
+        # Number of acceptance filters the interface offloads, None for unlimited.
+        # More IDs are merged into mask groups.
+        self.max_filters = max_filters
 
 class CANSignal:
     """
@@ -30,13 +44,147 @@ class CANSignal:
         length (int): The length of the signal in bytes.
         mapping (function, optional): A function to map the bythe data to the signal value,
                                       defaults to the identity function.
+        is_extended_id (bool, optional): The message uses an extended (29 bit) ID,
+                                         IDs above 0x7FF are always extended.
     """
 
-    def __init__(self, id, byte, length, mapping=(lambda x: x)):
+    def __init__(self, id, byte, length, mapping=(lambda x: x), is_extended_id=False):
         self.id = id
         self.byte = byte
         self.length = length  # in byte
         self.mapping = mapping
+        self.is_extended_id = is_extended_id
+
+    def raw(self, payload):
+        """
+        Returns the bytes of the signal within the payload.
+        """
+        return payload[self.byte - 1 : self.byte + self.length - 1]
+
+    def extract(self, payload):
+        """
+        Returns the mapped signal value of the payload.
+        """
+        return self.mapping(payload[self.byte - 1 : self.byte + self.length - 1])
+
+
+class BitSignal(CANSignal):
+    """
+    Signal defined by its bit position and scaling, as in DBC files:
+    SG_ <name> : <start_bit>|<bit_length>@<1: little endian, 0: big endian><+: unsigned, -: signed> (<factor>,<offset>) [<minimum>|<maximum>]
+
+    The definition is compiled once into an extractor that reads the signal
+    directly from the payload, without slicing the payload for every frame.
+    Attributes:
+        id (int): CAN message ID
+        start_bit (int): Start bit as in the DBC file
+                         (least significant bit for little endian,
+                         most significant bit for big endian signals)
+        bit_length (int): The length of the signal in bits.
+        little_endian (bool): Byte order, Intel (True) or Motorola (False).
+        signed (bool): Two's complement signed signal.
+        factor, offset (float): Physical value = raw value * factor + offset
+        minimum, maximum (float, optional): Physical value is limited to this range.
+        mapping (function, optional): A function to map the physical value to the signal value.
+        is_extended_id (bool, optional): See CANSignal.
+        byte, length (int): First byte (counting starts at 1) and number of bytes spanned by the signal.
+    """
+
+    def __init__(
+        self,
+        id,
+        start_bit,
+        bit_length,
+        little_endian=True,
+        signed=False,
+        factor=1.0,
+        offset=0.0,
+        minimum=None,
+        maximum=None,
+        mapping=None,
+        is_extended_id=False,
+    ):
+        self.id = id
+        self.is_extended_id = is_extended_id
+        self.start_bit = start_bit
+        self.bit_length = bit_length
+        self.little_endian = little_endian
+        self.signed = signed
+        self.factor = factor
+        self.offset = offset
+        self.minimum = minimum
+        self.maximum = maximum
+        self.mapping = mapping
+
+        if little_endian:
+            first_byte = start_bit // 8
+            last_byte = (start_bit + bit_length - 1) // 8
+            shift = start_bit % 8
+        else:
+            # position of the most / least significant bit counted from the
+            # most significant bit of the first payload byte
+            msb = (start_bit // 8) * 8 + 7 - start_bit % 8
+            lsb = msb + bit_length - 1
+            first_byte = msb // 8
+            last_byte = lsb // 8
+            shift = (last_byte + 1) * 8 - 1 - lsb
+        self.byte = first_byte + 1
+        self.length = last_byte - first_byte + 1
+        self.raw = _compile_raw(first_byte, self.length, little_endian, shift, bit_length)
+        self.extract = _compile_extract(self.raw, bit_length, signed, factor, offset, minimum, maximum, mapping)
+
+
+_STRUCT_FORMATS = {2: "H", 4: "I", 8: "Q"}
+
+
+def _compile_raw(first_byte, byte_count, little_endian, shift, bit_length):
+    """
+    Returns a function reading the unsigned raw value of a signal from a payload.
+    """
+    mask = (1 << bit_length) - 1
+    if byte_count == 1:
+        read = itemgetter(first_byte)
+    elif byte_count in _STRUCT_FORMATS:
+        unpack_from = Struct(("<" if little_endian else ">") + _STRUCT_FORMATS[byte_count]).unpack_from
+        read = lambda payload: unpack_from(payload, first_byte)[0]
+    else:
+        last_byte = first_byte + byte_count
+        byteorder = "little" if little_endian else "big"
+        read = lambda payload: int.from_bytes(payload[first_byte:last_byte], byteorder)
+
+    if shift == 0 and mask == (1 << (8 * byte_count)) - 1:
+        return read
+    if shift == 0:
+        return lambda payload: read(payload) & mask
+    return lambda payload: (read(payload) >> shift) & mask
+
+
+def _compile_extract(raw, bit_length, signed, factor, offset, minimum, maximum, mapping):
+    """
+    Returns a function computing the (mapped) physical value of a signal from a payload.
+    """
+    value = raw
+    if signed:
+        sign_bit = 1 << (bit_length - 1)
+        full_range = 1 << bit_length
+        unsigned = value
+
+        def value(payload):
+            x = unsigned(payload)
+            return x - full_range if x & sign_bit else x
+
+    if factor != 1.0 or offset != 0.0:
+        integer = value
+        value = lambda payload: integer(payload) * factor + offset
+    if minimum is not None or maximum is not None:
+        low = minimum if minimum is not None else float("-inf")
+        high = maximum if maximum is not None else float("inf")
+        unlimited = value
+        value = lambda payload: min(max(unlimited(payload), low), high)
+    if mapping is not None:
+        physical = value
+        value = lambda payload: mapping(physical(payload))
+    return value
 
 
 def gear_change_matcher(val):
@@ -84,13 +232,27 @@ def tesla_gear_change_matcher(val):
 
 
 class PollingMessage:
+    """
+    UDS request sent periodically in UDS mode.
+
+    Parameters:
+    arbitration_id: CAN ID of the request (ECU address).
+    data: Complete CAN message data, including the ISO-TP header.
+    polling_interval: Minimum time in seconds between two requests.
+    response_id: CAN ID of the ECU's responses, None to accept responses on any ID.
+    priority: Requests with lower priority values are sent first
+              when several requests to the same ECU are due (default 0).
+    """
+
     def __init__(
-        self, arbitration_id: int, data, is_extended_id=False, polling_interval=0.03
+        self, arbitration_id: int, data, is_extended_id=False, polling_interval=0.03, response_id=None, priority=0
     ):
         self.message = Message(
             arbitration_id=arbitration_id, data=data, is_extended_id=is_extended_id
         )
         self.interval = polling_interval
+        self.response_id = response_id
+        self.priority = priority
 
 
 class SignalConfiguration:
@@ -109,8 +271,19 @@ class SignalConfiguration:
              (default []).
     ident_filter: UDS only: Configuration will only be applied
                   if can_data[2:3] == ident_filter
-                  disabled on default
+                  disabled on default, prefer did for new configurations
                   (default []).
+    max_rate: Maximum number of frames per second decoded for this signal,
+              defaults to the max_rate of the vehicle (default None, unlimited).
+    rate_policy: RatePolicy applied when frames exceed max_rate,
+                 defaults to RatePolicy.Edges for Type.Button and Type.Gear
+                 and to RatePolicy.Latest otherwise (default None).
+    bus: Index of the CAN bus (in VehicleConfiguration.can_buses) carrying the signal,
+         None if the signal is received on all buses (default None).
+    did: UDS only: Data identifier of a ReadDataByIdentifier response carrying the signal.
+         The signal is decoded from the reassembled response sent on can_signal.id,
+         byte positions of can_signal count from the first data byte after the DID
+         (default None, the signal is decoded from single CAN frames).
 
     Attributes:
     id: The identifier of the configuration.
@@ -126,10 +299,15 @@ class SignalConfiguration:
                   if can_data[2:3] == ident_filter
                   disabled on default
                   (default []).
+    max_rate: Maximum decode rate in frames per second or None.
+    rate_policy: RatePolicy applied when frames exceed max_rate.
+    bus: Index of the CAN bus carrying the signal or None.
+    did: UDS data identifier of the response carrying the signal or None.
 
     Methods:
     can_id(): Returns the CAN ID of can_signal.
     match(can_id): Checks if the provided CAN ID matches the configuration's CAN ID.
+    raw(payload): Returns the bytes of the signal within a can message payload.
     value(payload): Interprets a can message payload and returns the mapped value.
 
     """
@@ -145,6 +323,10 @@ class SignalConfiguration:
         ident_filter:list[int]=[],
         ident_filter_mf:bool=False,
         cf_filter:list[int]=[],
+        max_rate:float=None,
+        rate_policy:RatePolicy=None,
+        bus:int=None,
+        did:int=None,
     ):
         self.id = id
         self.name = name
@@ -155,6 +337,15 @@ class SignalConfiguration:
         self.ident_filter = ident_filter
         self.ident_filter_mf = ident_filter_mf
         self.cf_filter = cf_filter
+        self.max_rate = max_rate
+        self.bus = bus
+        self.did = did
+        if rate_policy is None:
+            if type in (Type.Button, Type.Gear):
+                rate_policy = RatePolicy.Edges
+            else:
+                rate_policy = RatePolicy.Latest
+        self.rate_policy = rate_policy
 
     def can_id(self):
         return self.can_signal.id
@@ -162,18 +353,14 @@ class SignalConfiguration:
     def match(self, can_id):
         return self.can_signal.id == can_id
 
+    def raw(self, payload):
+        return self.can_signal.raw(payload)
+
     def value(self, payload):
         #if self.name == "brake":
         #    debug(
         #        f"Value for {self.name} = {bytes(payload[self.can_signal.byte-1: self.can_signal.byte+self.can_signal.length-1]).hex()}")
-        return self.can_signal.mapping(
-            payload[
-                self.can_signal.byte
-                - 1 : self.can_signal.byte
-                + self.can_signal.length
-                - 1
-            ]
-        )
+        return self.can_signal.extract(payload)
 
 
 vehicle_configurations = {}
@@ -193,7 +380,11 @@ class VehicleConfiguration:
         polling_interval_slow=None,
         polling_messages=list[PollingMessage],
         auto_detect_ids=[],
-        read_limiter=0
+        read_limiter=0,
+        max_rate=None,
+        dbc=None,
+        dbc_signals=[],
+        uds_batching=False,
     ):
         self.vehicle = vehicle
         self.operation_mode = operation_mode
@@ -202,11 +393,41 @@ class VehicleConfiguration:
         self.steering_deadzone = steering_deadzone
         self.steering_exponent = steering_exponent
         self.auto_detect_ids = auto_detect_ids
-        self.configurations = configurations
+        self._configurations = configurations
+        # DBC file and list of dbc.DBCSignalMapping, relative paths are
+        # resolved against the vehicle_configurations directory
+        if dbc is not None and not os.path.isabs(dbc):
+            dbc = os.path.join(os.path.dirname(__file__), "vehicle_configurations", dbc)
+        self.dbc = dbc
+        self.dbc_signals = dbc_signals
         self.polling_messages = polling_messages
+        # Combine ReadDataByIdentifier requests to the same ECU (UDS mode)
+        self.uds_batching = uds_batching
+        # Deprecated: skips read_limiter frames across all IDs, use max_rate instead
         self.read_limiter = read_limiter
+        # Default for SignalConfiguration.max_rate
+        self.max_rate = max_rate
         if not self.polling_messages and self.operation_mode == OperationMode.UDS:
             print("Error: UDS-mode requires to specify the polling messages!")
             exit(-1)
         else:
             vehicle_configurations[self.vehicle] = self
+
+    @property
+    def configurations(self) -> list[SignalConfiguration]:
+        """
+        The signal configurations, including the DBC signals.
+        The DBC file is loaded on first access, so only the selected vehicle loads its DBC file.
+        """
+        if self.dbc is not None:
+            from v2g_controller import dbc
+
+            self._configurations = self._configurations + dbc.signal_configurations(
+                self.dbc, self.dbc_signals, first_id=len(self._configurations)
+            )
+            self.dbc = None
+        return self._configurations
+
+    @configurations.setter
+    def configurations(self, configurations):
+        self._configurations = configurations
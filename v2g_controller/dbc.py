@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple
+
+from v2g_controller.helper import debug, cache_dir
+
+# Increase when the cached format changes
+CACHE_VERSION = 2
+
+# Bit 31 of the message ID marks extended IDs in DBC files
+EXTENDED_ID_FLAG = 0x80000000
+
+DBCSignal = namedtuple(
+    "DBCSignal",
+    [
+        "name",
+        "message",
+        "message_id",
+        "start_bit",
+        "bit_length",
+        "little_endian",
+        "signed",
+        "factor",
+        "offset",
+        "minimum",
+        "maximum",
+        "multiplexer",
+        "is_extended",
+    ],
+)
+DBCSignal.__doc__ = """
+Signal definition of a DBC file.
+multiplexer: None, "M" for the multiplexer signal or the multiplexer value of a multiplexed signal.
+is_extended: The message uses an extended (29 bit) ID.
+"""
+
+_MESSAGE = re.compile(r"^BO_\s+(\d+)\s+(\w+)\s*:")
+_SIGNAL = re.compile(
+    r"^SG_\s+(\w+)\s*(M|m\d+M?)?\s*:\s*(\d+)\|(\d+)@([01])([+-])\s*"
+    r"\(\s*([^,\s]+)\s*,\s*([^)\s]+)\s*\)\s*\[\s*([^|\s]+)\s*\|\s*([^\]\s]+)\s*\]"
+)
+
+
+def parse(text):
+    """
+    Parses the message and signal definitions (BO_ and SG_ lines) of a DBC file.
+
+    Returns:
+    List of DBCSignal.
+    """
+    signals = []
+    message = None
+    message_id = None
+    is_extended = False
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("BO_ "):
+            match = _MESSAGE.match(line)
+            if match:
+                message_id = int(match.group(1))
+                is_extended = bool(message_id & EXTENDED_ID_FLAG)
+                message_id &= ~EXTENDED_ID_FLAG
+                message = match.group(2)
+            continue
+        if not line.startswith("SG_ ") or message is None:
+            continue
+        match = _SIGNAL.match(line)
+        if match is None:
+            debug(f"DBC: skipping unsupported signal definition: {line}")
+            continue
+        name, mux, start_bit, bit_length, byte_order, sign, factor, offset, minimum, maximum = match.groups()
+        if mux is None:
+            multiplexer = None
+        elif mux == "M":
+            multiplexer = "M"
+        else:
+            multiplexer = int(mux[1:].rstrip("M"))
+        minimum = float(minimum)
+        maximum = float(maximum)
+        if minimum == 0.0 and maximum == 0.0:
+            # [0|0] means no range in DBC files
+            minimum = maximum = None
+        signals.append(
+            DBCSignal(
+                name,
+                message,
+                message_id,
+                int(start_bit),
+                int(bit_length),
+                byte_order == "1",
+                sign == "-",
+                float(factor),
+                float(offset),
+                minimum,
+                maximum,
+                multiplexer,
+                is_extended,
+            )
+        )
+    return signals
+
+
+class DBCDatabase:
+    """
+    Signals of a DBC file, looked up by "<signal>" or "<message>.<signal>".
+    """
+
+    def __init__(self, signals):
+        self.signals = {}
+        for signal in signals:
+            self.signals[f"{signal.message}.{signal.name}"] = signal
+            # ambiguous signal names have to be qualified with the message name
+            if signal.name in self.signals:
+                self.signals[signal.name] = None
+            else:
+                self.signals[signal.name] = signal
+
+    def signal(self, name) -> DBCSignal:
+        signal = self.signals.get(name, False)
+        if signal is None:
+            raise KeyError(f"Signal {name} is defined in several messages, use <message>.{name}")
+        if signal is False:
+            raise KeyError(f"Signal {name} is not defined")
+        return signal
+
+    def can_signal(self, name, mapping=None):
+        """
+        Returns a BitSignal with the compiled extractor of a DBC signal.
+        """
+        from v2g_controller.configuration_helper import BitSignal
+
+        signal = self.signal(name)
+        if signal.multiplexer not in (None, "M"):
+            raise KeyError(f"Multiplexed signal {name} is not supported")
+        return BitSignal(
+            signal.message_id,
+            signal.start_bit,
+            signal.bit_length,
+            little_endian=signal.little_endian,
+            signed=signal.signed,
+            factor=signal.factor,
+            offset=signal.offset,
+            minimum=signal.minimum,
+            maximum=signal.maximum,
+            mapping=mapping,
+            is_extended_id=signal.is_extended,
+        )
+
+
+def load(path, cache=True) -> DBCDatabase:
+    """
+    Loads a DBC file.
+
+    The parsed signals are cached on disk, keyed by the SHA-256 hash of the file,
+    so a DBC file is only parsed again after it has changed.
+
+    Args:
+    path: Path of the DBC file.
+    cache: Use the cache directory of helper.cache_dir().
+    """
+    with open(path, "rb") as dbc_file:
+        content = dbc_file.read()
+    digest = hashlib.sha256(content).hexdigest()
+    cache_path = os.path.join(cache_dir(), "dbc", f"{digest}.json") if cache else None
+
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            with open(cache_path) as cache_file:
+                cached = json.load(cache_file)
+            if cached["version"] == CACHE_VERSION:
+                debug(f"DBC: using cached signals of {path}")
+                return DBCDatabase(DBCSignal(*signal) for signal in cached["signals"])
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            debug(f"DBC: ignoring invalid cache {cache_path}: {error}")
+
+    debug(f"DBC: parsing {path}")
+    signals = parse(content.decode("latin-1"))
+    if cache_path is not None:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            temporary = f"{cache_path}.{os.getpid()}.tmp"
+            with open(temporary, "w") as cache_file:
+                json.dump({"version": CACHE_VERSION, "path": path, "signals": signals}, cache_file)
+            os.replace(temporary, cache_path)
+        except OSError as error:
+            debug(f"DBC: could not write cache {cache_path}: {error}")
+    return DBCDatabase(signals)
+
+
+class DBCSignalMapping:
+    """
+    Maps a DBC signal to a signal of the V2G controller.
+
+    Parameters:
+    signal: Name of the DBC signal, "<signal>" or "<message>.<signal>".
+    type: The Type of the signal.
+    buttons: Array of Buttons, see SignalConfiguration (default []).
+    mapping: Function mapping the physical value of the DBC signal, e.g. range_map
+             for Type.Steering or a gear change matcher for Type.Gear (default None).
+    name: Name of the signal configuration (default: name of the DBC signal).
+    max_rate, rate_policy, bus: See SignalConfiguration.
+    """
+
+    def __init__(self, signal, type, buttons=[], mapping=None, name=None, max_rate=None, rate_policy=None, bus=None):
+        self.signal = signal
+        self.type = type
+        self.buttons = buttons
+        self.mapping = mapping
+        self.name = name if name is not None else signal.rpartition(".")[2]
+        self.max_rate = max_rate
+        self.rate_policy = rate_policy
+        self.bus = bus
+
+
+def signal_configurations(path, mappings, first_id=0, cache=True):
+    """
+    Returns the SignalConfigurations for DBC signals.
+
+    Args:
+    path: Path of the DBC file.
+    mappings: List of DBCSignalMapping.
+    first_id: id of the first SignalConfiguration.
+    """
+    from v2g_controller.configuration_helper import SignalConfiguration
+
+    database = load(path, cache)
+    configurations = []
+    for index, mapping in enumerate(mappings):
+        try:
+            can_signal = database.can_signal(mapping.signal, mapping.mapping)
+        except KeyError as error:
+            print(f"Error: {path}: {error.args[0]}")
+            exit(-1)
+        configurations.append(
+            SignalConfiguration(
+                id=first_id + index,
+                name=mapping.name,
+                can_signal=can_signal,
+                type=mapping.type,
+                buttons=mapping.buttons,
+                max_rate=mapping.max_rate,
+                rate_policy=mapping.rate_policy,
+                bus=mapping.bus,
+            )
+        )
+    return configurations
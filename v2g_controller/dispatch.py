@@ -0,0 +1,97 @@
+class DispatchTable:
+    """
+    Precompiled lookup of the signal configurations that apply to a CAN frame.
+
+    The configurations of a vehicle are indexed once by arbitration ID and,
+    for UDS configurations, by the ident bytes (``ident_filter``) and the
+    first-byte filter (``cf_filter``). A lookup then costs one dict access
+    per arbitration ID plus one per distinct filter layout used on that ID,
+    instead of a scan over all configurations.
+
+    The result is identical to matching every configuration in order
+    (see ``CarConnector._match_linear``).
+    """
+
+    def __init__(self, configurations):
+        """
+        Compile the dispatch index.
+
+        Args:
+        configurations: list of SignalConfiguration objects, in priority order.
+        """
+        entries = {}
+        for index, config in enumerate(configurations):
+            if config.did is not None:
+                # decoded from reassembled UDS responses, see CarConnector.on_uds_response
+                continue
+            entry = entries.setdefault(config.can_signal.id, ([], {}))
+            if config.ident_filter == [] and config.cf_filter == []:
+                entry[0].append((index, config))
+                continue
+            ident_pos = None
+            ident_key = None
+            if config.ident_filter != []:
+                ident_pos = 2 if config.ident_filter_mf == False else 3
+                ident_key = (config.ident_filter[0], config.ident_filter[1])
+            cf_key = config.cf_filter[0] if config.cf_filter != [] else None
+            probe = entry[1].setdefault((ident_pos, cf_key is not None), {})
+            probe.setdefault((ident_key, cf_key), []).append((index, config))
+
+        self.table = {}
+        for can_id, (unfiltered, probes) in entries.items():
+            compiled_probes = []
+            for (ident_pos, use_cf), keys in probes.items():
+                min_length = ident_pos + 2 if ident_pos is not None else 1
+                compiled_probes.append((
+                    ident_pos,
+                    use_cf,
+                    min_length,
+                    {key: (tuple(matches), tuple(config for _, config in matches)) for key, matches in keys.items()},
+                ))
+            self.table[can_id] = (
+                tuple(config for _, config in unfiltered),
+                tuple(unfiltered),
+                tuple(compiled_probes),
+            )
+
+    def ids(self):
+        """
+        Returns the arbitration IDs known to the table.
+        """
+        return self.table.keys()
+
+    def lookup(self, arbitration_id, data):
+        """
+        Returns the configurations to apply to a frame, in configuration order.
+
+        Args:
+        arbitration_id: CAN ID of the frame.
+        data: Payload of the frame.
+        """
+        entry = self.table.get(arbitration_id)
+        if entry is None:
+            return ()
+        unfiltered, indexed_unfiltered, probes = entry
+        if not probes:
+            return unfiltered
+
+        matched = None
+        for ident_pos, use_cf, min_length, keys in probes:
+            if len(data) < min_length:
+                continue
+            ident_key = (data[ident_pos], data[ident_pos + 1]) if ident_pos is not None else None
+            cf_key = data[0] if use_cf else None
+            hits = keys.get((ident_key, cf_key))
+            if hits is None:
+                continue
+            if matched is None:
+                matched = hits
+            else:
+                matched = (matched[0] + hits[0], None)
+
+        if matched is None:
+            return unfiltered
+        if not indexed_unfiltered and matched[1] is not None:
+            return matched[1]
+        ordered = sorted(indexed_unfiltered + matched[0], key=lambda hit: hit[0])
+        return tuple(config for _, config in ordered)
@@ -19,7 +19,8 @@ class HumanInterfaceDevice(object):
         return self.state
 
     def send_report(self):
-        self.report_function(self.state)
+        if not self.holding_reports:
+            self.report_function(self.state)
 
     def get_name(self):
         return self.MY_DEV_NAME
@@ -31,7 +32,16 @@ class HumanInterfaceDevice(object):
         return self.UUID
 
 
+# Gamepad input report: report id, X-axis and Y-axis between -127 and 127,
+# unsigned char representing the buttons, rest of bits are constants
+GAMEPAD_REPORT = struct.Struct("<BbbB")
+
+# Bits of the buttons in the report, other buttons are not reported
+BUTTON_MASKS = {Buttons.A: 0x01, Buttons.B: 0x02, Buttons.X: 0x08, Buttons.Y: 0x10}
+
 # Class that represents the Gamepad state
+# The report is encoded into a buffer allocated once, updates between
+# begin_report() and end_report() are encoded and sent as a single report
 class BTGamepad(HumanInterfaceDevice, AbstractGamePad):
 
     def __init__(self, report_function):
@@ -41,39 +51,58 @@ class BTGamepad(HumanInterfaceDevice, AbstractGamePad):
         self.SDP_RECORD_PATH = sys.path[0] + "/v2g_controller/gamepads/HIDpi/sdp/sdp_record_gamepad.xml"
 
         # Define the Gamepad state
-        self.state.extend(struct.pack("b", 0x00))  # X-axis between -127 and 127
-        self.state.extend(struct.pack("b", 0x00))  # Y-axis between -127 and 127
-        # self.state.extend(struct.pack("b", 0x00))  # Z-axis between -127 and 127
-        self.state.extend(struct.pack("B", 0x00))  # unsigned char representing 3 buttons, rest of bits are constants
-        
-        self.mybuttons = {Buttons.A : 0, Buttons.B : 0, Buttons.X : 0, Buttons.Y : 0}
+        self.state = bytearray(GAMEPAD_REPORT.size)
+        self.view = memoryview(self.state)
+        self.buttons = 0
 
         self.x = 0.0
-        self.y = 0.0
-        self.y_zero = False
+        # the left stick Y-axis (throttle) and the left trigger (brake) share the Y-axis of the report,
+        # both are kept so the axis does not depend on which of them was updated last
+        self.throttle = 0.0
+        self.brake = 0.0
         self.z = 0.0
+        # True if the state changed since the last report
+        self.changed = False
+        self._encode()
 
-    def _update_btn_state(self):
-        # vorne oben unten
-        self.state[3] = struct.pack("B", self.mybuttons[Buttons.A] + 2 * self.mybuttons[Buttons.B] + 8 * self.mybuttons[Buttons.X] + 16 *self.mybuttons[Buttons.Y])[0]
-    
-    def _update_x_axis_state(self):
-        self.state[1] = struct.pack("b", int(self.x * 127.0))[0]
+    def quantize_axis(self, value):
+        return int(value * 127.0)
+
+    def quantize_trigger(self, value):
+        # the left trigger is reported on the Y-axis
+        return int(value * 127.0)
+
+    def get_state(self):
+        return self.view
+
+    def end_report(self):
+        self.holding_reports = False
+        if self.changed:
+            self.send_report()
+
+    def send_report(self):
+        self.changed = True
+        if not self.holding_reports:
+            self._encode()
+            self.changed = False
+            self.report_function(self.view)
 
-    def _update_y_axis_state(self):
-        self.state[2] = struct.pack("b", int(self.y * 127.0))[0]
+    def _encode(self):
+        # a pressed brake takes precedence over the throttle
+        y = self.brake if self.brake > 0 else self.throttle
+        GAMEPAD_REPORT.pack_into(self.state, 0, 0xA1, int(self.x * 127.0), int(y * 127.0), self.buttons)
 
-    # def _update_Z_axis_state(self):
-    #    self.state[3] = struct.pack("b", int(self.z * 127.0))[0]
-   
     def update_button(self, id, state):
         """
         Set button state
         id: Buttons enum
         state: 0 or 1
         """
-        self.mybuttons[id] = state
-        self._update_btn_state()
+        mask = BUTTON_MASKS.get(id, 0)
+        if state:
+            self.buttons |= mask
+        else:
+            self.buttons &= ~mask
         self.send_report()
 
     def update_js_left(self, x, y):
@@ -83,15 +112,7 @@ class BTGamepad(HumanInterfaceDevice, AbstractGamePad):
         y: -1.0 to 1.0
         """
         self.x = x
-        if y != 0:
-            self.y = -y
-            self.y_zero = False
-        elif not self.y_zero:
-            self.y = -y
-            self.y_zero = True
-            
-        self._update_x_axis_state()
-        self._update_y_axis_state()
+        self.throttle = -y
         self.send_report()
 
     def update_js_right(self, x, y):
@@ -105,10 +126,7 @@ class BTGamepad(HumanInterfaceDevice, AbstractGamePad):
         Set left trigger position
         value: 0.0 to 1.0
         """
-        self.y = value
-        #self.y = y
-        self._update_y_axis_state()
-        #self._update_y_axis_state()
+        self.brake = value
         self.send_report()
         
     def update_tg_right(self, value):
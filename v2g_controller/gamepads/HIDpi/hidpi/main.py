@@ -15,6 +15,10 @@ def start(args = None, start_func = None):
     
     # Run v2g controller is provided
     if start_func is not None:
-        start_func(args, myservice.device)
+        start_func(args, myservice.device, main_loop=mainloop)
+
+    if args is not None and args.metrics and args.metrics_interval > 0:
+        from v2g_controller.metrics import SummaryThread
+        SummaryThread(myservice, args.metrics_interval).start()
     
     mainloop.run()
\ No newline at end of file
@@ -2,12 +2,14 @@ from __future__ import absolute_import, print_function
 
 import sys
 import socket
+import time
 
 import dbus
 import dbus.service
 import dbus.mainloop.glib
 
 from gi.repository import GObject as gobject
+from gi.repository import GLib
 
 import v2g_controller.gamepads.HIDpi.hidpi.hid
 import v2g_controller.gamepads.HIDpi.hidpi as hidpi
@@ -100,6 +102,9 @@ class BluezHIDProfile(dbus.service.Object):
     control_channel = None
     interrupt_channel = None
 
+    # Minimum time between two input reports in seconds, the HID host polls the device at most every 10 ms
+    REPORT_INTERVAL = 0.01
+
 
     def __init__(self, bus, path, physical_address):
         # Register this Bluez Profile on the DBUS
@@ -107,6 +112,21 @@ class BluezHIDProfile(dbus.service.Object):
 
         self.MY_ADDRESS = physical_address
 
+        # Latest input report not sent yet, newer reports overwrite it
+        self.report = bytearray()
+        self.report_pending = False
+        self.last_report = 0.0
+        # GLib source of the scheduled send (timeout or writable watch), None if idle
+        self.send_source = None
+        self.reports_sent = 0
+        self.reports_superseded = 0
+        self.reports_dropped = 0
+        self.send_blocked = 0
+
+        # Called with True when both channels are connected and with False when one of them is closed
+        self.on_connection_changed = None
+        self.connected = False
+
         # Manually set up sockets
         # Bluez doesn't handle this automatically for HID profiles
         # (Probably because Bluez only returns a single communication channel and HID requires two always)
@@ -134,6 +154,7 @@ class BluezHIDProfile(dbus.service.Object):
     # Close connections and exit gracefully
     @dbus.service.method("org.bluez.Profile1", in_signature="", out_signature="")
     def Release(self):
+        self.cancel_report()
         gobject.source_remove(self.interrupt_socket.fileno())
         gobject.source_remove(self.control_socket.fileno())
 
@@ -174,14 +195,18 @@ class BluezHIDProfile(dbus.service.Object):
         self.control_channel, cinfo = self.control_socket.accept()
         gobject.io_add_watch(self.control_channel.fileno(), gobject.IO_ERR | gobject.IO_HUP, self.close_control)
         gobject.io_add_watch(self.control_channel.fileno(), gobject.IO_IN | gobject.IO_PRI, self.callback, self.control_channel)
+        self.connection_changed()
         return False  # Stop watching, we only accept one connection
 
     # Accept a connection from the interrupt socket and create a channel
     # Start watching for IO input and errors by adding an IO watch
     def accept_interrupt(self, source, cond):
         self.interrupt_channel, cinfo = self.interrupt_socket.accept()
+        # reports are sent without blocking the main loop, see send_input_report
+        self.interrupt_channel.setblocking(False)
         gobject.io_add_watch(self.interrupt_channel.fileno(), gobject.IO_ERR | gobject.IO_HUP, self.close_interrupt)
         gobject.io_add_watch(self.interrupt_channel.fileno(), gobject.IO_IN | gobject.IO_PRI, self.callback, self.interrupt_channel)
+        self.connection_changed()
         return False
 
     # Receive messages from the HID host
@@ -202,6 +227,7 @@ class BluezHIDProfile(dbus.service.Object):
             gobject.source_remove(source)  # Remove any remaining watch
             self.control_channel.close()
             self.control_channel = None
+            self.connection_changed()
 
             self.listen(self.control_socket, self.accept_control)
         except:
@@ -213,8 +239,10 @@ class BluezHIDProfile(dbus.service.Object):
     def close_interrupt(self, source, condition):
         try:
             gobject.source_remove(source)  # Remove any remaining watch
+            self.cancel_report()
             self.interrupt_channel.close()
             self.interrupt_channel = None
+            self.connection_changed()
 
             self.listen(self.interrupt_socket, self.accept_interrupt)
         except:
@@ -222,19 +250,118 @@ class BluezHIDProfile(dbus.service.Object):
         return False
 
     # Send an input report given a device state represented by a bytearray
+    # Only the latest report is kept: it is sent once REPORT_INTERVAL has passed since the previous one
+    # and the interrupt channel accepts it, a report still pending is overwritten (superseded)
     def send_input_report(self, device_state):
-        try:
-            if self.interrupt_channel is not None:
-                self.interrupt_channel.send(device_state)
-        except:
-            print("Error while attempting to send report.")
+        if self.interrupt_channel is None:
+            self.reports_dropped += 1
+            return True
+        if self.report_pending:
+            self.reports_superseded += 1
+        self.report[:] = device_state
+        self.report_pending = True
+        if self.send_source is None:
+            self._send_report()
         return True  # Return True to support adding a timeout function
 
+    # Send the pending report now, or schedule it for the end of the report interval
+    # or for when the interrupt channel becomes writable again
+    def _send_report(self):
+        self.send_source = None
+        if not self.report_pending or self.interrupt_channel is None:
+            return False
+        delay = self.last_report + self.REPORT_INTERVAL - time.monotonic()
+        if delay > 0:
+            self.send_source = GLib.timeout_add(int(delay * 1000) + 1, self._send_report)
+            return False
+        try:
+            # L2CAP keeps the report boundaries, a report is either sent completely or not at all
+            self.interrupt_channel.send(self.report)
+        except BlockingIOError:
+            # the send window of the host is full, wait until the channel is writable
+            self.send_blocked += 1
+            self.send_source = GLib.io_add_watch(
+                self.interrupt_channel.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_OUT, self._on_writable
+            )
+            return False
+        except OSError as error:
+            self.reports_dropped += 1
+            self.report_pending = False
+            print(f"Error while attempting to send report: {error}")
+            return False
+        self.report_pending = False
+        self.reports_sent += 1
+        self.last_report = time.monotonic()
+        return False
+
+    def _on_writable(self, source, condition):
+        self._send_report()
+        return False
+
+    # Drop the pending report and its scheduled send, e.g. when the interrupt channel is closed
+    def cancel_report(self):
+        if self.send_source is not None:
+            GLib.source_remove(self.send_source)
+            self.send_source = None
+        if self.report_pending:
+            self.report_pending = False
+            self.reports_dropped += 1
+
+    def format_summary(self):
+        return (
+            f"HID reports: {self.reports_sent} sent, {self.reports_superseded} superseded, "
+            f"{self.reports_dropped} dropped, {self.send_blocked} times blocked (EAGAIN)"
+        )
+
     # Return True if there is a connection on both the control and interrupt channels
     # Return False otherwise
     def is_connected(self):
         return (self.control_channel is not None) and (self.interrupt_channel is not None)
 
+    # Call on_connection_changed if the connection state changed
+    def connection_changed(self):
+        connected = self.is_connected()
+        if connected != self.connected:
+            self.connected = connected
+            if self.on_connection_changed is not None:
+                self.on_connection_changed(connected)
+
+
+# Cache of the properties of the Bluez adapter, only changed values are sent over D-Bus
+# The cache follows the PropertiesChanged signals of the adapter, e.g. when Bluez ends discoverability after the timeout
+class AdapterProperties:
+    ADAPTER = "org.bluez.Adapter1"
+
+    def __init__(self, system_bus, path):
+        self.interface = dbus.Interface(system_bus.get_object("org.bluez", path), "org.freedesktop.DBus.Properties")
+        self.values = {}
+        # Called with the name and value of each property changed by Bluez
+        self.on_changed = None
+        system_bus.add_signal_receiver(
+            self.properties_changed,
+            signal_name="PropertiesChanged",
+            dbus_interface="org.freedesktop.DBus.Properties",
+            path=path,
+        )
+
+    def properties_changed(self, interface, changed, invalidated):
+        if interface != self.ADAPTER:
+            return
+        for name, value in changed.items():
+            self.values[str(name)] = value
+            if self.on_changed is not None:
+                self.on_changed(str(name), value)
+        for name in invalidated:
+            self.values.pop(str(name), None)
+
+    # Set a property, returns False without a D-Bus call if it already has the value
+    def set(self, name, value):
+        if name in self.values and self.values[name] == value:
+            return False
+        self.interface.Set(self.ADAPTER, name, value)
+        self.values[name] = value
+        return True
+
 
 # Create a Bluetooth service to emulate a HID device
 class BTHIDService:
@@ -274,19 +401,22 @@ class BTHIDService:
         # Retrieve the system bus
         system_bus = dbus.SystemBus()
 
-        # Retrieve the Bluez Bluetooth Adapter interface
-        self.ADAPTER_INTERFACE = dbus.Interface(system_bus.get_object("org.bluez", "/org/bluez/hci0"), "org.freedesktop.DBus.Properties")
+        # Retrieve the Bluez Bluetooth Adapter properties
+        self.adapter = AdapterProperties(system_bus, "/org/bluez/hci0")
+        self.ADAPTER_INTERFACE = self.adapter.interface
+        self.adapter.on_changed = self.adapter_changed
 
         # Power the Bluetooth adapter
-        self.ADAPTER_INTERFACE.Set('org.bluez.Adapter1', 'Powered', dbus.Boolean(1))
+        self.adapter.set('Powered', dbus.Boolean(1))
 
         # Allow the Bluetooth Adapter to pair
-        self.ADAPTER_INTERFACE.Set('org.bluez.Adapter1', 'PairableTimeout', dbus.UInt32(0))
-        self.ADAPTER_INTERFACE.Set('org.bluez.Adapter1', 'Pairable', dbus.Boolean(1))
+        self.adapter.set('PairableTimeout', dbus.UInt32(0))
+        self.adapter.set('Pairable', dbus.Boolean(1))
 
-        # Allow the Bluetooth Adapter to be discoverable for 30 seconds
-        self.ADAPTER_INTERFACE.Set('org.bluez.Adapter1', 'DiscoverableTimeout', dbus.UInt32(180))
-        self.ADAPTER_INTERFACE.Set('org.bluez.Adapter1', 'Discoverable', dbus.Boolean(1))
+        # Allow the Bluetooth Adapter to be discoverable for 180 seconds
+        self.state = None
+        self.reports_disconnected = 0
+        self.make_discoverable()
 
         print("Configuring Bluez Agent.")
 
@@ -305,6 +435,7 @@ class BTHIDService:
 
         # Create our Bluez HID Profile
         self.profile = BluezHIDProfile(system_bus, self.PROFILE_DBUS_PATH, physical_address)
+        self.profile.on_connection_changed = self.connection_changed
 
         # Retrieve the Bluez Bluetooth Profile Manager interface
         self.PROFILE_MANAGER_INTERFACE = dbus.Interface(system_bus.get_object("org.bluez", "/org/bluez"), "org.bluez.ProfileManager1")
@@ -323,10 +454,38 @@ class BTHIDService:
 
         return fh.read()
 
+    # Discoverability states, changed by connection events and the adapter properties, not by reports
+    CONNECTED = "connected"  # a HID host is connected
+    DISCOVERABLE = "discoverable"  # no host connected, the adapter is discoverable
+    HIDDEN = "hidden"  # no host connected, the discoverable timeout expired
+
+    # Make the adapter discoverable for 180 seconds, only changed properties are set
+    def make_discoverable(self):
+        self.adapter.set('DiscoverableTimeout', dbus.UInt32(180))
+        self.adapter.set('Discoverable', dbus.Boolean(1))
+        self.state = self.DISCOVERABLE
+
+    # Called by the profile when a host connects or disconnects
+    def connection_changed(self, connected):
+        if connected:
+            self.state = self.CONNECTED
+        else:
+            self.make_discoverable()
+
+    # Called for adapter properties changed by Bluez
+    def adapter_changed(self, name, value):
+        if name == 'Discoverable' and not value and self.state == self.DISCOVERABLE:
+            self.state = self.HIDDEN
+
     def send_input_report(self, state):
-        if self.profile.is_connected():
+        if self.state == self.CONNECTED:
             self.profile.send_input_report(state)
-        else:
-            # Allow the Bluetooth Adapter to be discoverable again for 30 seconds
-            self.ADAPTER_INTERFACE.Set('org.bluez.Adapter1', 'DiscoverableTimeout', dbus.UInt32(180))
-            self.ADAPTER_INTERFACE.Set('org.bluez.Adapter1', 'Discoverable', dbus.Boolean(1))
+            return
+        # no host connected, the report is dropped
+        self.reports_disconnected += 1
+        if self.state == self.HIDDEN:
+            # the vehicle is in use, allow a host to find the adapter again
+            self.make_discoverable()
+
+    def format_summary(self):
+        return f"{self.profile.format_summary()}, {self.reports_disconnected} while disconnected"
@@ -1,31 +1,86 @@
 from enum import IntFlag
-import vgamepad as vg
+try:
+    import vgamepad as vg
+    XUSB_BUTTON = vg.XUSB_BUTTON
+except ImportError:
+    # vgamepad is only required for the virtual gamepad,
+    # replay and headless gamepads use the XUSB values directly
+    class XUSB_BUTTON(IntFlag):
+        XUSB_GAMEPAD_DPAD_UP = 0x0001
+        XUSB_GAMEPAD_DPAD_DOWN = 0x0002
+        XUSB_GAMEPAD_DPAD_LEFT = 0x0004
+        XUSB_GAMEPAD_DPAD_RIGHT = 0x0008
+        XUSB_GAMEPAD_START = 0x0010
+        XUSB_GAMEPAD_BACK = 0x0020
+        XUSB_GAMEPAD_LEFT_THUMB = 0x0040
+        XUSB_GAMEPAD_RIGHT_THUMB = 0x0080
+        XUSB_GAMEPAD_LEFT_SHOULDER = 0x0100
+        XUSB_GAMEPAD_RIGHT_SHOULDER = 0x0200
+        XUSB_GAMEPAD_GUIDE = 0x0400
+        XUSB_GAMEPAD_A = 0x1000
+        XUSB_GAMEPAD_B = 0x2000
+        XUSB_GAMEPAD_X = 0x4000
+        XUSB_GAMEPAD_Y = 0x8000
 
 class Buttons(IntFlag):
     """
     Possible XUSB report buttons.
     """
-    UP = vg.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_UP
-    DOWN = vg.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_DOWN
-    LEFT = vg.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_LEFT
-    RIGHT = vg.XUSB_BUTTON.XUSB_GAMEPAD_DPAD_RIGHT
-    START = vg.XUSB_BUTTON.XUSB_GAMEPAD_START
-    BACK = vg.XUSB_BUTTON.XUSB_GAMEPAD_BACK
-    LEFT_THUMB = vg.XUSB_BUTTON.XUSB_GAMEPAD_LEFT_THUMB
-    RIGHT_THUMB = vg.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB
-    LEFT_SHOULDER = vg.XUSB_BUTTON.XUSB_GAMEPAD_LEFT_SHOULDER
-    RIGHT_SHOULDER = vg.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_SHOULDER
-    GUIDE = vg.XUSB_BUTTON.XUSB_GAMEPAD_GUIDE
-    A = vg.XUSB_BUTTON.XUSB_GAMEPAD_A
-    B = vg.XUSB_BUTTON.XUSB_GAMEPAD_B
-    X = vg.XUSB_BUTTON.XUSB_GAMEPAD_X
-    Y = vg.XUSB_BUTTON.XUSB_GAMEPAD_Y
+    UP = XUSB_BUTTON.XUSB_GAMEPAD_DPAD_UP
+    DOWN = XUSB_BUTTON.XUSB_GAMEPAD_DPAD_DOWN
+    LEFT = XUSB_BUTTON.XUSB_GAMEPAD_DPAD_LEFT
+    RIGHT = XUSB_BUTTON.XUSB_GAMEPAD_DPAD_RIGHT
+    START = XUSB_BUTTON.XUSB_GAMEPAD_START
+    BACK = XUSB_BUTTON.XUSB_GAMEPAD_BACK
+    LEFT_THUMB = XUSB_BUTTON.XUSB_GAMEPAD_LEFT_THUMB
+    RIGHT_THUMB = XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB
+    LEFT_SHOULDER = XUSB_BUTTON.XUSB_GAMEPAD_LEFT_SHOULDER
+    RIGHT_SHOULDER = XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_SHOULDER
+    GUIDE = XUSB_BUTTON.XUSB_GAMEPAD_GUIDE
+    A = XUSB_BUTTON.XUSB_GAMEPAD_A
+    B = XUSB_BUTTON.XUSB_GAMEPAD_B
+    X = XUSB_BUTTON.XUSB_GAMEPAD_X
+    Y = XUSB_BUTTON.XUSB_GAMEPAD_Y
 
 from abc import ABC, abstractmethod
 class AbstractGamePad(ABC):
+    # Resolution of the emitted axis and trigger values,
+    # used to detect updates that do not change the report
+    AXIS_RESOLUTION = 32767
+    TRIGGER_RESOLUTION = 255
+
+    # True while reports are held back between begin_report() and end_report()
+    holding_reports = False
 
     def __init__(self):
         self.gamepad = None
+
+    def quantize_axis(self, value):
+        """
+        Returns the axis value as emitted in the report
+        value: -1.0 to 1.0
+        """
+        return round(value * self.AXIS_RESOLUTION)
+
+    def quantize_trigger(self, value):
+        """
+        Returns the trigger value as emitted in the report
+        value: 0.0 to 1.0
+        """
+        return round(value * self.TRIGGER_RESOLUTION)
+
+    def begin_report(self):
+        """
+        Hold back reports until end_report() is called,
+        so that several updates are sent as a single report
+        """
+        self.holding_reports = True
+
+    def end_report(self):
+        """
+        Send the updates since begin_report() as a single report
+        """
+        self.holding_reports = False
     
     @abstractmethod
     def click_button(self, id, latency=0):
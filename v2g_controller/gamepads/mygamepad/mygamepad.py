@@ -9,7 +9,17 @@ from v2g_controller.gamepads.abstract_gamepad import AbstractGamePad, Buttons
 class MyGamepad(AbstractGamePad):
     def __init__(self):
         self.gamepad = vg.VX360Gamepad()
-        
+
+    def end_report(self):
+        """
+        Send the updates since begin_report() as a single report
+        """
+        self.holding_reports = False
+        self.gamepad.update()
+
+    def _report(self):
+        if not self.holding_reports:
+            self.gamepad.update()
         
     def click_button(self, id, latency=0):
         """
@@ -35,7 +45,7 @@ class MyGamepad(AbstractGamePad):
             self.gamepad.press_button(button=id)
         else:
             self.gamepad.release_button(button=id)
-        self.gamepad.update()
+        self._report()
 
     def update_js_left(self, x, y):
         """
@@ -44,7 +54,7 @@ class MyGamepad(AbstractGamePad):
         y: -1.0 to 1.0
         """
         self.gamepad.left_joystick_float(x_value_float=x, y_value_float=y)
-        self.gamepad.update()
+        self._report()
 
     def update_js_right(self, x, y):
         """
@@ -53,7 +63,7 @@ class MyGamepad(AbstractGamePad):
         y: -1.0 to 1.0
         """
         self.gamepad.right_joystick_float(x_value_float=x, y_value_float=y)
-        self.gamepad.update()
+        self._report()
         
     def update_tg_left(self, value):
         """
@@ -61,7 +71,7 @@ class MyGamepad(AbstractGamePad):
         value: 0.0 to 1.0
         """
         self.gamepad.left_trigger_float(value_float=value)
-        self.gamepad.update()
+        self._report()
         
     def update_tg_right(self, value):
         """
@@ -69,4 +79,4 @@ class MyGamepad(AbstractGamePad):
         value: 0.0 to 1.0
         """
         self.gamepad.right_trigger_float(value_float=value)
-        self.gamepad.update()
\ No newline at end of file
+        self._report()
\ No newline at end of file
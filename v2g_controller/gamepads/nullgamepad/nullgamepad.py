@@ -0,0 +1,28 @@
+from v2g_controller.gamepads.abstract_gamepad import AbstractGamePad
+
+# Gamepad without a device, used for benchmarks and load tests,
+# recorder.RecordingGamepad also records the calls and reports
+
+
+class NullGamepad(AbstractGamePad):
+    def __init__(self):
+        self.gamepad = None
+
+    def click_button(self, id, latency=0):
+        pass
+
+    def update_button(self, id, state):
+        pass
+
+    def update_js_left(self, x, y):
+        pass
+
+    def update_js_right(self, x, y):
+        pass
+
+    def update_tg_left(self, value):
+        pass
+
+    def update_tg_right(self, value):
+        pass
+
@@ -0,0 +1,208 @@
+import time
+
+from v2g_controller.gamepads.abstract_gamepad import AbstractGamePad
+
+# Records the gamepad reports as text lines instead of driving a device,
+# used to replay CAN logs and compare the output of different versions.
+# Line format: <time> <left x> <left y> <right x> <right y> <left trigger> <right trigger> <buttons>
+
+
+class ReportRecorder(AbstractGamePad):
+    def __init__(self, stream=None, clock=None):
+        """
+        stream: text stream the reports are written to, None to only count them
+        clock: function returning the report time, defaults to time.time
+        """
+        self.gamepad = None
+        self.stream = stream
+        self.clock = clock if clock is not None else time.time
+        self.reports = 0
+        self.js_left = (0, 0)
+        self.js_right = (0, 0)
+        self.tg_left = 0
+        self.tg_right = 0
+        self.buttons = 0
+
+    def end_report(self):
+        """
+        Record the updates since begin_report() as a single report
+        """
+        self.holding_reports = False
+        self._report()
+
+    def _report(self):
+        if self.holding_reports:
+            return
+        self.reports += 1
+        self.record()
+
+    def record(self):
+        """
+        Write the current report to the stream
+        """
+        if self.stream is not None:
+            self.stream.write(
+                f"{self.clock():.6f} {self.js_left[0]} {self.js_left[1]} {self.js_right[0]} {self.js_right[1]} "
+                f"{self.tg_left} {self.tg_right} {self.buttons:#06x}\n"
+            )
+
+    def click_button(self, id, latency=0):
+        """
+        Press and release button, recorded as two reports
+        id: Buttons enum
+        latency: ignored
+        """
+        self.update_button(id, 1)
+        self.update_button(id, 0)
+
+    def update_button(self, id, state):
+        """
+        Set button state
+        id: Buttons enum
+        state: 0 or 1
+        """
+        if state == 1:
+            self.buttons |= int(id)
+        else:
+            self.buttons &= ~int(id)
+        self._report()
+
+    def update_js_left(self, x, y):
+        """
+        Set left gamepad position
+        x: -1.0 to 1.0
+        y: -1.0 to 1.0
+        """
+        self.js_left = (self.quantize_axis(x), self.quantize_axis(y))
+        self._report()
+
+    def update_js_right(self, x, y):
+        """
+        Set right gamepad position
+        x: -1.0 to 1.0
+        y: -1.0 to 1.0
+        """
+        self.js_right = (self.quantize_axis(x), self.quantize_axis(y))
+        self._report()
+
+    def update_tg_left(self, value):
+        """
+        Set left trigger position
+        value: 0.0 to 1.0
+        """
+        self.tg_left = self.quantize_trigger(value)
+        self._report()
+
+    def update_tg_right(self, value):
+        """
+        Set right trigger position
+        value: 0.0 to 1.0
+        """
+        self.tg_right = self.quantize_trigger(value)
+        self._report()
+
+
+class RecordingGamepad(ReportRecorder):
+    """
+    Report recorder for load tests that records every gamepad call in a preallocated ring buffer.
+
+    The buffer consists of parallel arrays holding the time of the call
+    (time.perf_counter), the name of the called method and its arguments.
+    Sent reports are recorded as "report" calls without arguments, their
+    times are used for the report rate and jitter statistics printed with
+    the metrics summary.
+    """
+
+    def __init__(self, capacity=65536):
+        super().__init__(clock=time.perf_counter)
+        self.capacity = capacity
+        self.calls = 0
+        self.times = [0.0] * capacity
+        self.methods = [None] * capacity
+        self.arguments = [None] * capacity
+
+    def _call(self, method, arguments=()):
+        index = self.calls % self.capacity
+        self.times[index] = self.clock()
+        self.methods[index] = method
+        self.arguments[index] = arguments
+        self.calls += 1
+
+    def record(self):
+        self._call("report")
+
+    def begin_report(self):
+        self._call("begin_report")
+        super().begin_report()
+
+    def end_report(self):
+        self._call("end_report")
+        super().end_report()
+
+    def click_button(self, id, latency=0):
+        self._call("click_button", (id, latency))
+        super().click_button(id, latency)
+
+    def update_button(self, id, state):
+        self._call("update_button", (id, state))
+        super().update_button(id, state)
+
+    def update_js_left(self, x, y):
+        self._call("update_js_left", (x, y))
+        super().update_js_left(x, y)
+
+    def update_js_right(self, x, y):
+        self._call("update_js_right", (x, y))
+        super().update_js_right(x, y)
+
+    def update_tg_left(self, value):
+        self._call("update_tg_left", (value,))
+        super().update_tg_left(value)
+
+    def update_tg_right(self, value):
+        self._call("update_tg_right", (value,))
+        super().update_tg_right(value)
+
+    def _indices(self):
+        """
+        Returns the buffer indices of the recorded calls, oldest first.
+        """
+        start = max(0, self.calls - self.capacity)
+        return [i % self.capacity for i in range(start, self.calls)]
+
+    def entries(self):
+        """
+        Returns the buffered calls as (time, method, arguments), oldest first.
+        """
+        return [(self.times[i], self.methods[i], self.arguments[i]) for i in self._indices()]
+
+    def statistics(self):
+        """
+        Returns the number of calls and reports, the report rate and the jitter of the report intervals of the buffered reports.
+        """
+        report_times = [self.times[i] for i in self._indices() if self.methods[i] == "report"]
+        intervals = [b - a for a, b in zip(report_times, report_times[1:])]
+        if not intervals:
+            return {"calls": self.calls, "reports": self.reports, "rate": 0.0}
+        mean = sum(intervals) / len(intervals)
+        variance = sum((interval - mean) ** 2 for interval in intervals) / len(intervals)
+        return {
+            "calls": self.calls,
+            "reports": self.reports,
+            "rate": 1.0 / mean if mean > 0 else 0.0,
+            "interval_mean": mean,
+            "interval_min": min(intervals),
+            "interval_max": max(intervals),
+            "jitter": variance ** 0.5,
+        }
+
+    def format_summary(self):
+        statistics = self.statistics()
+        if "jitter" not in statistics:
+            return f"Gamepad: {statistics['calls']} calls, {statistics['reports']} reports"
+        return (
+            f"Gamepad: {statistics['calls']} calls, {statistics['reports']} reports, "
+            f"{statistics['rate']:.1f} reports/s, interval {statistics['interval_mean'] * 1e3:.2f} ms "
+            f"(min {statistics['interval_min'] * 1e3:.2f} ms, max {statistics['interval_max'] * 1e3:.2f} ms), "
+            f"jitter {statistics['jitter'] * 1e3:.2f} ms"
+        )
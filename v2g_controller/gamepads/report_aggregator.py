@@ -0,0 +1,203 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+from v2g_controller.gamepads.abstract_gamepad import AbstractGamePad
+
+
+class ReportAggregator(AbstractGamePad):
+    """
+    Gamepad wrapper that coalesces updates into change-only reports.
+
+    Updates are collected until flush() is called. Only updates that change
+    the quantized report state of the wrapped gamepad (e.g. int16 axes for
+    XUSB, int8 axes for BTGamepad) are forwarded, all of them within a single
+    report. A button press and release within the same tick are sent as two
+    reports, so no button press gets lost. Unchanged fields are not sent
+    again, so the wrapped gamepad has to keep the state of every field, also
+    of fields sharing a report value (e.g. throttle and brake on the Y-axis
+    of BTGamepad).
+
+    The update methods may be called from several threads while another
+    thread calls flush(). Axis and trigger updates only replace an entry of
+    a dict, which is atomic in CPython. Button updates read the pending
+    state before keeping it as an edge, so they hold the lock, as does
+    flush() while it takes the snapshot and the edges; the reports are sent
+    without holding it. Only the flushing thread accesses the wrapped
+    gamepad.
+    """
+
+    # Maximum number of button edges buffered between two flushes
+    MAX_EDGES = 64
+
+    def __init__(self, gamepad: AbstractGamePad, tick=0.01):
+        """
+        Args:
+        gamepad: The gamepad to send the reports to.
+        tick: Minimum time in seconds between two reports sent by maybe_flush().
+        """
+        self.gamepad = gamepad
+        self.tick = tick
+        self.last_flush = None
+        self._sequence = itertools.count(1)
+        # report field -> (sequence, quantized value, update method, arguments, source time)
+        self.latest = {}
+        # button updates that would otherwise be overwritten before being reported
+        self.edges = deque(maxlen=self.MAX_EDGES)
+        # sequence number of the newest update included in the last flush
+        self.flushed = 0
+        # report field -> quantized value of the last report
+        self.emitted = {}
+        # CAN timestamp of the frame currently being decoded, set by the caller
+        self.source_time = None
+        # called without arguments after every update, e.g. to wake an output thread
+        self.on_update = None
+        # called without arguments after the first report, e.g. to measure the startup time
+        self.on_first_report = None
+        self.reports = 0
+        # Metrics object recording report rate and latency, or None
+        self.metrics = None
+        # guards the button edges and the flushed sequence number against concurrent updates
+        self.lock = threading.Lock()
+
+    def _update(self, key, quantized, method, args):
+        self.latest[key] = (next(self._sequence), quantized, method, args, self.source_time)
+        if self.on_update is not None:
+            self.on_update()
+
+    def update_button(self, id, state):
+        """
+        Set button state
+        id: Buttons enum
+        state: 0 or 1
+        """
+        with self.lock:
+            previous = self.latest.get(id)
+            if previous is not None and previous[0] > self.flushed and previous[1] != state:
+                # the pending state has not been reported yet, keep it as an edge
+                self.edges.append((id, previous))
+            self.latest[id] = (next(self._sequence), state, self.gamepad.update_button, (id, state), self.source_time)
+        if self.on_update is not None:
+            self.on_update()
+
+    def update_js_left(self, x, y):
+        """
+        Set left gamepad position
+        x: -1.0 to 1.0
+        y: -1.0 to 1.0
+        """
+        quantized = (self.gamepad.quantize_axis(x), self.gamepad.quantize_axis(y))
+        self._update("js_left", quantized, self.gamepad.update_js_left, (x, y))
+
+    def update_js_right(self, x, y):
+        """
+        Set right gamepad position
+        x: -1.0 to 1.0
+        y: -1.0 to 1.0
+        """
+        quantized = (self.gamepad.quantize_axis(x), self.gamepad.quantize_axis(y))
+        self._update("js_right", quantized, self.gamepad.update_js_right, (x, y))
+
+    def update_tg_left(self, value):
+        """
+        Set left trigger position
+        value: 0.0 to 1.0
+        """
+        quantized = self.gamepad.quantize_trigger(value)
+        self._update("tg_left", quantized, self.gamepad.update_tg_left, (value,))
+
+    def update_tg_right(self, value):
+        """
+        Set right trigger position
+        value: 0.0 to 1.0
+        """
+        quantized = self.gamepad.quantize_trigger(value)
+        self._update("tg_right", quantized, self.gamepad.update_tg_right, (value,))
+
+    def click_button(self, id, latency=0):
+        """
+        Press and release button, pending updates are sent first.
+        Must be called from the flushing thread.
+        id: Buttons enum
+        latency: time in seconds to hold button
+        """
+        self.flush()
+        self.gamepad.click_button(id, latency)
+
+    def _send(self, changes):
+        emitted = self.emitted
+        start = time.perf_counter() if self.metrics is not None else 0.0
+        self.gamepad.begin_report()
+        try:
+            for key, (_, quantized, method, args, _) in changes:
+                method(*args)
+                emitted[key] = quantized
+        finally:
+            self.gamepad.end_report()
+        self.reports += 1
+        if self.reports == 1 and self.on_first_report is not None:
+            self.on_first_report()
+
+        if self.metrics is not None:
+            self.metrics.report_send.observe(time.perf_counter() - start)
+            oldest = None
+            for _, (_, _, _, _, source_time) in changes:
+                if source_time is not None and (oldest is None or source_time < oldest):
+                    oldest = source_time
+            self.metrics.report(oldest)
+
+    def flush(self, now=None) -> bool:
+        """
+        Send the pending updates that change the report as a single report.
+
+        Args:
+        now: Current time in seconds, used to pace maybe_flush().
+
+        Returns:
+        True if a report was sent.
+        """
+        if now is not None:
+            self.last_flush = now
+        # take the snapshot together with the edges: every edge appended
+        # afterwards belongs to an update newer than the snapshot
+        with self.lock:
+            snapshot = self.latest.copy()
+            edges = list(self.edges)
+            self.edges.clear()
+            flushed = self.flushed
+            newest = flushed
+            for entry in snapshot.values():
+                if entry[0] > newest:
+                    newest = entry[0]
+            self.flushed = newest
+        sent = False
+        for id, entry in edges:
+            if self.emitted.get(id, 0) != entry[1]:
+                self._send([(id, entry)])
+                sent = True
+
+        emitted = self.emitted
+        changes = []
+        for key, entry in snapshot.items():
+            if entry[0] > flushed and emitted.get(key) != entry[1]:
+                changes.append((key, entry))
+        if not changes:
+            return sent
+        changes.sort(key=lambda change: change[1][0])
+        self._send(changes)
+        return True
+
+    def maybe_flush(self, now) -> bool:
+        """
+        Flush if at least one tick has passed since the last flush.
+
+        Args:
+        now: Current time in seconds.
+
+        Returns:
+        True if a report was sent.
+        """
+        if self.last_flush is not None and 0 <= now - self.last_flush < self.tick:
+            return False
+        return self.flush(now)
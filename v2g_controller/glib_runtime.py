@@ -0,0 +1,138 @@
+import time
+
+import can
+from gi.repository import GLib
+
+
+class GLibNotifier:
+    """
+    Calls listeners for the frames of a bus from the GLib main loop.
+
+    Used in Bluetooth mode: the file descriptor of the bus is watched with
+    GLib.io_add_watch, like the L2CAP sockets of the HID profile, so frames
+    are decoded and reports are sent on the main loop without any other
+    thread touching the sockets. Each wakeup reads the queued frames, at most
+    max_batch, so other sources of the main loop are not starved. Buses
+    without a file descriptor (e.g. the virtual bus) are polled instead.
+
+    Provides the parts of the can.Notifier interface used by the BusManager.
+    """
+
+    def __init__(self, bus, listeners, metrics=None, max_batch=32, poll_interval=1):
+        """
+        Args:
+        bus: The bus to read.
+        listeners: The listeners to call for each frame.
+        metrics: Metrics object recording the duration of each main loop callback, or None.
+        max_batch: Maximum number of frames read per callback.
+        poll_interval: Polling interval in milliseconds for buses without a file descriptor.
+        """
+        self.bus = bus
+        self.listeners = list(listeners)
+        self.metrics = metrics
+        self.max_batch = max_batch
+        try:
+            fileno = bus.fileno()
+        except NotImplementedError:
+            fileno = -1
+        if fileno >= 0:
+            self.source = GLib.io_add_watch(fileno, GLib.PRIORITY_DEFAULT, GLib.IO_IN | GLib.IO_PRI, self._on_readable)
+        else:
+            self.source = GLib.timeout_add(poll_interval, self._on_readable)
+
+    def _on_readable(self, *_):
+        start = time.perf_counter()
+        bus = self.bus
+        listeners = self.listeners
+        frames = 0
+        try:
+            while frames < self.max_batch:
+                msg = bus.recv(0)
+                if msg is None:
+                    break
+                frames += 1
+                for listener in listeners:
+                    listener.on_message_received(msg)
+        except can.CanError as error:
+            print(f"Error: Reading CAN bus {bus.channel_info} failed: {error}")
+        if frames and self.metrics is not None:
+            self.metrics.loop_iteration("can", time.perf_counter() - start)
+        return True
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def stop(self, timeout=None):
+        if self.source is not None:
+            GLib.source_remove(self.source)
+            self.source = None
+
+
+class GLibPoller:
+    """
+    Drives a UDSPoller from the GLib main loop instead of its thread.
+
+    A timeout is scheduled for the deadline returned by service(). Responses
+    wake the poller through set(), which replaces the wakeup event of the
+    poller and services it on the next main loop iteration.
+    """
+
+    def __init__(self, poller):
+        self.poller = poller
+        self.timeout = None
+        self.scheduled = False
+        poller.wakeup = self
+
+    def set(self):
+        if not self.scheduled:
+            self.scheduled = True
+            GLib.idle_add(self._service)
+
+    def clear(self):
+        pass
+
+    def _service(self):
+        self.scheduled = False
+        if self.timeout is not None:
+            GLib.source_remove(self.timeout)
+            self.timeout = None
+        if not self.poller.running:
+            return False
+        deadline = self.poller.service(time.monotonic())
+        delay = max(0, int((deadline - time.monotonic()) * 1000))
+        self.timeout = GLib.timeout_add(delay, self._on_timeout)
+        return False
+
+    def _on_timeout(self):
+        self.timeout = None
+        self._service()
+        return False
+
+    def start(self):
+        self.poller.running = True
+        self.set()
+
+
+class LoopMonitor:
+    """
+    Measures how late the GLib main loop runs a periodic timeout,
+    i.e. how long other callbacks block the loop.
+    """
+
+    def __init__(self, metrics, interval=0.01):
+        self.metrics = metrics
+        self.interval = interval
+        self.expected = None
+
+    def _on_timeout(self):
+        now = time.monotonic()
+        self.metrics.loop_iteration("lag", max(0.0, now - self.expected))
+        self.expected = now + self.interval
+        return True
+
+    def start(self):
+        self.expected = time.monotonic() + self.interval
+        GLib.timeout_add(int(self.interval * 1000), self._on_timeout)
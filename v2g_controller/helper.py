@@ -1,3 +1,7 @@
+import os
+import threading
+import time
+
 debug_enabled = False
 
 def range_map(x, in_min, in_max, out_min, out_max):
@@ -7,9 +11,41 @@ def range_map(x, in_min, in_max, out_min, out_max):
         return out_max
     return (x - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
 
+def cache_dir():
+    """
+    Returns the directory for local caches, $V2G_CACHE_DIR or ~/.cache/v2g_controller.
+    """
+    return os.environ.get("V2G_CACHE_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "v2g_controller"
+    )
+
 def debug(msg, overwrite=False):
     if debug_enabled:
         if not overwrite:
             print(msg)
         else:
-            print(msg, end="\r")
\ No newline at end of file
+            print(msg, end="\r")
+
+
+class StatusLine(threading.Thread):
+    """
+    Prints a status line in place at a fixed refresh rate.
+
+    The line is rendered lazily from this background thread, so the code
+    producing the state does no string formatting or terminal I/O.
+    """
+
+    def __init__(self, render, interval=0.2):
+        """
+        Args:
+        render: Function returning the status line.
+        interval: Time in seconds between two refreshes.
+        """
+        super().__init__(name="v2g-status", daemon=True)
+        self.render = render
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            debug(self.render(), overwrite=True)
@@ -0,0 +1,184 @@
+import can
+
+# ISO-TP frame types (upper nibble of the first byte)
+SINGLE_FRAME = 0
+FIRST_FRAME = 1
+CONSECUTIVE_FRAME = 2
+FLOW_CONTROL = 3
+
+# flow status of flow control frames
+CONTINUE_TO_SEND = 0x30
+OVERFLOW = 0x32
+
+PADDING = 0x55
+# maximum message length with a 12 bit first frame length
+MAX_LENGTH = 4095
+
+
+class IsoTpReceiver:
+    """
+    Reassembles the ISO-TP messages received on one CAN ID.
+
+    The frames are copied into a buffer allocated once, feed() returns a
+    memoryview of the complete message within this buffer. First frames are
+    answered with a flow control frame, so the sender continues with the
+    consecutive frames; with a block size, another flow control frame is sent
+    after each block. Single frames and first frames with the CAN FD length
+    escape are supported.
+    """
+
+    def __init__(self, bus, tx_id, is_extended_id=False, block_size=0, st_min=0, max_length=MAX_LENGTH):
+        """
+        Args:
+        bus: The bus to send flow control frames on, None to only listen (e.g. replaying a log).
+        tx_id: CAN ID of the flow control frames (the request ID of the ECU).
+        block_size: Consecutive frames the sender may send per flow control frame, 0 for all.
+        st_min: Minimum separation time requested from the sender, as encoded in the flow control frame.
+        max_length: Size of the receive buffer, longer messages are rejected with an overflow flow control frame.
+        """
+        self.bus = bus
+        self.block_size = block_size
+        self.flow_control = can.Message(
+            arbitration_id=tx_id,
+            data=bytes([CONTINUE_TO_SEND, block_size, st_min]) + bytes([PADDING]) * 5,
+            is_extended_id=is_extended_id,
+        )
+        self.overflow = can.Message(
+            arbitration_id=tx_id,
+            data=bytes([OVERFLOW, 0, 0]) + bytes([PADDING]) * 5,
+            is_extended_id=is_extended_id,
+        )
+        self.buffer = bytearray(max_length)
+        self.view = memoryview(self.buffer)
+        # length of the message in progress, 0 if none
+        self.length = 0
+        self.received = 0
+        self.sequence = 0
+        self.block = 0
+        self.messages = 0
+        self.multi_frame = 0
+        self.aborted = 0
+
+    def _send(self, msg):
+        if self.bus is None:
+            return True
+        try:
+            self.bus.send(msg)
+            return True
+        except can.CanError:
+            return False
+
+    def _abort(self):
+        self.length = 0
+        self.aborted += 1
+        return None
+
+    def feed(self, data):
+        """
+        Processes a frame.
+
+        Returns:
+        A memoryview of the complete message (UDS payload) or None.
+        The view is only valid until the next call.
+        """
+        frame = memoryview(data)
+        frame_type = frame[0] >> 4
+        if frame_type == SINGLE_FRAME:
+            if self.length:
+                self._abort()
+            length = frame[0] & 0x0F
+            offset = 1
+            if length == 0 and len(frame) > 8:
+                # CAN FD single frame
+                length = frame[1]
+                offset = 2
+            if length == 0 or offset + length > len(frame):
+                return None
+            self.view[:length] = frame[offset : offset + length]
+            self.messages += 1
+            return self.view[:length]
+        if frame_type == FIRST_FRAME:
+            if self.length:
+                self._abort()
+            if len(frame) < 8:
+                # first frames always use the full frame
+                return None
+            length = ((frame[0] & 0x0F) << 8) | frame[1]
+            offset = 2
+            if length == 0:
+                # 32 bit length escape
+                length = int.from_bytes(frame[2:6], "big")
+                offset = 6
+            if length > len(self.buffer):
+                self._send(self.overflow)
+                self.aborted += 1
+                return None
+            received = min(len(frame) - offset, length)
+            self.view[:received] = frame[offset : offset + received]
+            self.length = length
+            self.received = received
+            self.sequence = 1
+            self.block = 0
+            if not self._send(self.flow_control):
+                return self._abort()
+            return None
+        if frame_type == CONSECUTIVE_FRAME and self.length:
+            if frame[0] & 0x0F != self.sequence:
+                # lost frame, drop the message
+                return self._abort()
+            self.sequence = (self.sequence + 1) & 0x0F
+            received = min(len(frame) - 1, self.length - self.received)
+            self.view[self.received : self.received + received] = frame[1 : 1 + received]
+            self.received += received
+            if self.received >= self.length:
+                length = self.length
+                self.length = 0
+                self.messages += 1
+                self.multi_frame += 1
+                return self.view[:length]
+            if self.block_size:
+                self.block += 1
+                if self.block == self.block_size:
+                    self.block = 0
+                    if not self._send(self.flow_control):
+                        return self._abort()
+        return None
+
+
+class IsoTpListener(can.Listener):
+    """
+    Reassembles the ISO-TP messages of several response IDs and passes the
+    complete messages to a handler.
+    """
+
+    def __init__(self, bus, channels, handler):
+        """
+        Args:
+        bus: The bus to send flow control frames on, or None.
+        channels: Dict of response ID -> (request ID, is_extended_id).
+        handler: Called as handler(response_id, payload, msg) for each complete message,
+                 with payload a memoryview valid only during the call and msg the last frame.
+        """
+        self.handler = handler
+        self.receivers = {
+            response_id: IsoTpReceiver(bus, tx_id, is_extended_id)
+            for response_id, (tx_id, is_extended_id) in channels.items()
+        }
+
+    def on_message_received(self, msg: can.Message):
+        receiver = self.receivers.get(msg.arbitration_id)
+        if receiver is None or not msg.data:
+            return
+        payload = receiver.feed(msg.data)
+        if payload is not None:
+            self.handler(msg.arbitration_id, payload, msg)
+
+    def statistics(self):
+        """
+        Returns the number of complete, multi-frame and aborted messages.
+        """
+        return {
+            "messages": sum(receiver.messages for receiver in self.receivers.values()),
+            "multi_frame": sum(receiver.multi_frame for receiver in self.receivers.values()),
+            "aborted": sum(receiver.aborted for receiver in self.receivers.values()),
+        }
@@ -6,121 +6,123 @@ import can
 import time
 import platform
 import sys
+import threading
 
 
 import v2g_controller.configuration_helper as cfh
 from v2g_controller.helper import debug
 import v2g_controller.helper as h
 from v2g_controller.car_connector import CarConnector
+from v2g_controller.output import OutputThread, GLibOutput, AsyncioOutput
+import v2g_controller.metrics as metrics
+from v2g_controller.gamepads.nullgamepad.nullgamepad import NullGamepad
+from v2g_controller.gamepads.recorder.recorder import RecordingGamepad
 import v2g_controller.car_detector as car_detector
+import v2g_controller.vehicle_manifest as vehicle_manifest
+import v2g_controller.vehicle_cache as vehicle_cache
+from v2g_controller.bus_manager import BusManager
+from v2g_controller.uds_poller import UDSPoller, response_channels
+from v2g_controller.isotp import IsoTpListener
+import v2g_controller.startup as startup
+import v2g_controller.can_filters as can_filters
 
-from pkgutil import iter_modules
-from pathlib import Path
-from importlib import import_module
-import subprocess
+# set when the process has to be restarted, e.g. when the cached vehicle was not verified,
+# the main loop then stops and the process restarts from the main thread
+restart_requested = threading.Event()
+# called without arguments to stop the main loop of the runtime, None for loop()
+_stop_main_loop = None
+# the bus manager and the components stopped by shutdown(), set by start()
+_bus_manager = None
+_components = []
 
 
+def load_vehicle_configurations():
+    # Import all vehicle configurations, only required to work with all vehicles,
+    # start() only loads the selected vehicle
+    debug('Loading vehicle configurations...')
+    vehicle_manifest.load_all()
 
-def init_can_bus(port, bus_type, bitrate, data_bitrate=None):
-    if platform.system() == "Linux":
-        channel_prefix = "can"
-        channel = f"{channel_prefix}{port}"
-        if bus_type == "standard":
-            debug(f"Using standard CAN bus on channel {channel}, checking interface state:" )
-            try:
-                subprocess.run(["grep", "down", f"/sys/class/net/{channel}/operstate"], check=True)
-                debug("CAN interface is down, attempting to bring up")
-                subprocess.run(["sudo", "ip", "link", "set" ,f"{channel}", "up", "type", "can", "bitrate", f"{bitrate}"], check=False)
-            except subprocess.CalledProcessError:
-                pass
-            can_bus = can.Bus(
-                interface="socketcan",
-                channel=channel,
-                bitrate=bitrate,
-            )
-        elif bus_type == "fd":
-            debug(f"Using CAN FD bus on channel {channel}, checking interface state:" )
-            try:
-                subprocess.run(["grep", "down", f"/sys/class/net/{channel}/operstate"], check=True)
-                debug("CAN interface is down, attempting to bring up")
-                subprocess.run(["sudo", "ip", "link", "set" ,f"{channel}", "up", "type", "can", "bitrate", f"{bitrate}", "fd", "on", "dbitrate", f"{data_bitrate}"], check=False)
-            except subprocess.CalledProcessError:
-                pass
-            can_bus = can.Bus(
-                interface="socketcan",
-                channel=channel,
-                bitrate=bitrate,
-                data_bitrate=data_bitrate,
-                fd=True,
-            )
-        else:
-            debug("Invalid CAN bus type supplied for Linux")
-            return None
-    elif platform.system() == "Windows":
-        if port == 0:
-            channel = "PCAN_USBBUS1"
-        elif port == 1:
-            channel = "PCAN_USBBUS2"
-        else:
-            debug("Invalid CAN bus port supplied for Windows")
-            return None
-        if bus_type == "standard":
-            debug(f"Using standard CAN bus on channel {channel}" )
-            can_bus = can.Bus(
-                interface="pcan",
-                channel=channel,
-                bitrate=bitrate,
-            )
-        elif buy_type == "fd":
-            debug(f"Using CAN FD bus on channel {channel}" )
-            can_bus = can.Bus(
-                interface="pcan",
-                channel=channel,
-                fd=True,
-                f_clock_mhz=80,
-                nom_brp=10,
-                nom_tseg1=12,
-                nom_tseg2=3,
-                nom_sjw=3,
-                data_brp=2,
-                data_tseg1=15,
-                data_tseg2=4,
-                data_sjw=4,
-            )
-        else:
-            debug("Invalid CAN bus type supplied for Windows")
-            return None
-    else:
-        debug("Unsupported operating system")
-        return None
-    return can_bus
+    debug('Configured vehicles:')
+    for vehicle in cfh.vehicle_configurations:
+        debug(f" - {vehicle}")
 
-def start(args, gamepad = None):
+def request_restart():
+    """
+    Requests a restart of the process, may be called from any thread.
+    """
+    restart_requested.set()
+    if _stop_main_loop is not None:
+        _stop_main_loop()
+
+def shutdown():
+    """
+    Stops the UDS polling and the gamepad output and closes the CAN buses.
+    """
+    for component in _components:
+        component.stop()
+    _components.clear()
+    if _bus_manager is not None:
+        _bus_manager.shutdown()
+
+def restart_if_requested():
+    """
+    Shuts down and restarts the process with the same arguments if a restart was requested.
+    Must be called from the main thread after the main loop has stopped.
+    """
+    if restart_requested.is_set():
+        shutdown()
+        vehicle_cache.restart()
+
+def start(args, gamepad = None, event_loop = None, main_loop = None):
+    """
+    Args:
+    gamepad: The gamepad to use, e.g. the Bluetooth gamepad, else selected by args.gamepad.
+    event_loop: asyncio event loop running the buses, polling and output, or None for threads.
+    main_loop: GLib main loop of the Bluetooth mode, stopped when a restart is requested.
+    """
+    global _stop_main_loop, _bus_manager
     if args.debug:
         h.debug_enabled = True
     debug(" *** v2g_controller ***")
-    
-    # Dynamically import all python files in vehicle_configurations
-    debug('Loading vehicle configurations...')
-    package_dir = Path(__file__).resolve().parent.joinpath("vehicle_configurations")
-    for (_, module_name, _) in iter_modules([package_dir]):
-        module = import_module(f"v2g_controller.vehicle_configurations.{module_name}")
-        
+    startup.mark("modules imported")
+
     debug('Configured vehicles:')
-    for vehicle in cfh.vehicle_configurations:
+    for vehicle in vehicle_manifest.manifests():
         debug(f" - {vehicle}")
+    bus_manager = BusManager()
+    _bus_manager = bus_manager
+    if event_loop is not None:
+        _stop_main_loop = lambda: event_loop.call_soon_threadsafe(event_loop.stop)
+    elif main_loop is not None:
+        from gi.repository import GLib
+        _stop_main_loop = lambda: GLib.idle_add(main_loop.quit)
+    verifier = None
     if args.vehicle == "AUTO":
-        args.vehicle = car_detector.detect_vehicle()      
+        cached = None if args.no_cache else vehicle_cache.load()
+        if cached is not None:
+            # start the last detected vehicle immediately, verify it in the background
+            args.vehicle, fingerprint = cached
+            debug(f"Using cached vehicle {args.vehicle}, verifying in the background")
+            verifier = vehicle_cache.VehicleVerifier(args.vehicle, fingerprint, on_mismatch=request_restart)
+        else:
+            observed = set()
+            args.vehicle = car_detector.detect_vehicle(bus_manager, observed)
+            if args.vehicle != "NONE":
+                vehicle_cache.save(args.vehicle, observed)
+        startup.mark("vehicle detected")
     debug('Selected vehicle:')
     if args.vehicle == "NONE" and args.btcontroller:
         debug("No vehicle detected, defaulting to ID3_UDS")
         args.vehicle = "ID3_UDS"
     debug(f" - {args.vehicle}")
-    try:
-        vehicle_configuration: cfh.VehicleConfiguration = cfh.vehicle_configurations[args.vehicle]
-    except KeyError:
+    vehicle_configuration: cfh.VehicleConfiguration = vehicle_manifest.load(args.vehicle)
+    if vehicle_configuration is None:
         print("Error: Selected Vehicle is not configured!")
         sys.exit(1)
+    startup.mark("configuration loaded")
+    if event_loop is not None:
+        # all buses, the polling and the output run on the event loop
+        bus_manager.attach_loop(event_loop)
 
     if platform.system() == "Linux":
         debug("Running on Linux")
@@ -129,37 +131,124 @@ def start(args, gamepad = None):
     else:
         debug("Running on Unsupported OS")
     
-    # generate filter
-    filters = []
-    filter_ids = []
-    for config in vehicle_configuration.configurations:
-        if filter_ids.count(hex(config.can_signal.id)) == 0:
-            filter_ids.append(hex(config.can_signal.id))
-            filters.append(
-                {"can_id": config.can_signal.id, "can_mask": 0x7FF, "extended": False}
-            )
-        
-    
+    if gamepad is None and args.gamepad == "null":
+        gamepad = NullGamepad()
+    elif gamepad is None and args.gamepad == "recording":
+        gamepad = RecordingGamepad()
+        metrics.SummaryThread(gamepad, args.metrics_interval if args.metrics_interval > 0 else 10.0).start()
+
+    pipeline_metrics = None
+    if args.metrics:
+        pipeline_metrics = metrics.Metrics()
+        pipeline_metrics.startup = startup.timer
+        if args.metrics_interval > 0:
+            metrics.SummaryThread(pipeline_metrics, args.metrics_interval).start()
+        if args.metrics_endpoint:
+            metrics.serve(pipeline_metrics, args.metrics_endpoint)
+            debug(f"Serving metrics on {args.metrics_endpoint}")
+
+    if args.btcontroller:
+        # decode the frames and send the reports on the GLib main loop, which also serves the HID sockets
+        import v2g_controller.glib_runtime as glib_runtime
+        bus_manager.attach_glib(pipeline_metrics)
+        if pipeline_metrics is not None:
+            glib_runtime.LoopMonitor(pipeline_metrics).start()
+
     # init car connector
-    car_connector = CarConnector(gamepad=gamepad, vehicle_config=vehicle_configuration)
+    car_connector = CarConnector(
+        gamepad=gamepad,
+        vehicle_config=vehicle_configuration,
+        linear_dispatch=args.linear_dispatch,
+        output_tick=args.output_tick if args.output_tick >= 0 else None,
+        metrics=pipeline_metrics,
+    )
+    if car_connector.aggregator is not None:
+        car_connector.aggregator.on_first_report = lambda: startup.mark("first report")
+        # a single output thread (or the GLib main loop in BT mode) owns the gamepad
+        if args.btcontroller:
+            output = GLibOutput(car_connector.aggregator)
+        elif event_loop is not None:
+            output = AsyncioOutput(car_connector.aggregator, event_loop)
+        else:
+            output = OutputThread(car_connector.aggregator)
+        car_connector.flush_inline = False
+        output.watch(car_connector)
+        output.start()
+        _components.append(output)
+    if h.debug_enabled and args.status_rate > 0:
+        h.StatusLine(car_connector.status, 1.0 / args.status_rate).start()
 
+    # reuses the detection bus if the settings match
     can_buses = []
     for i, bus in enumerate(vehicle_configuration.can_buses):
-        can_buses.append(init_can_bus(i, bus.type, bus.bitrate, bus.data_bitrate))
+        can_buses.append(bus_manager.open(i, bus.type, bus.bitrate, bus.data_bitrate))
     
     # initialize polling
+    poller = None
+    uds_listener = None
     if vehicle_configuration.operation_mode == cfh.OperationMode.UDS:
         debug(f"Initializing UDS polling ...")
-        for polling_msg in vehicle_configuration.polling_messages:
-            can_buses[0].send_periodic(polling_msg.message, polling_msg.interval)
-            time.sleep(polling_msg.interval / 5)
-        
-    debug(f"Applying filters for the following IDs: {filter_ids}")
-    for bus in can_buses:
-        bus.set_filters(filters)
-        can.Notifier(bus, [car_connector])
+        if args.uds_periodic:
+            for polling_msg in vehicle_configuration.polling_messages:
+                can_buses[0].send_periodic(polling_msg.message, polling_msg.interval)
+                time.sleep(polling_msg.interval / 5)
+            # reassembles the responses for signals configured by DID
+            uds_listener = IsoTpListener(
+                can_buses[0], response_channels(vehicle_configuration.polling_messages), car_connector.on_pdu
+            )
+        else:
+            poller = UDSPoller(
+                can_buses[0],
+                vehicle_configuration.polling_messages,
+                batching=vehicle_configuration.uds_batching,
+                sink=car_connector,
+            )
+            uds_listener = poller
+            if args.metrics and args.metrics_interval > 0:
+                metrics.SummaryThread(poller, args.metrics_interval).start()
+
+    # minimal filters per bus
+    filters = can_filters.bus_filters(vehicle_configuration)
+    for i, bus in enumerate(can_buses):
+        bus.set_filters(filters[i])
+    if verifier is not None:
+        # receive the fingerprint IDs on bus 0 until the vehicle is verified
+        can_buses[0].set_filters(can_filters.bus_filters(vehicle_configuration, {0: verifier.missing})[0])
+        verifier.on_done = lambda: can_buses[0].set_filters(filters[0])
+    for i, bus in enumerate(can_buses):
+        listeners = [car_connector]
+        if i == 0 and verifier is not None:
+            listeners.append(verifier)
+        if i == 0 and uds_listener is not None:
+            listeners.append(uds_listener)
+        bus_manager.listen(i, listeners)
+    if poller is not None:
+        _components.append(poller)
+        if event_loop is not None:
+            event_loop.create_task(poller.run_async())
+        elif args.btcontroller:
+            glib_runtime.GLibPoller(poller).start()
+        else:
+            poller.start()
+    if verifier is not None:
+        verifier.start()
+    startup.mark("CAN buses ready")
 
 def loop():
-    # Keep program running to handle CAN signals
-    while True:
-        time.sleep(100)
+    # Keep program running to handle CAN signals, until a restart is requested
+    while not restart_requested.wait(100):
+        pass
+    restart_if_requested()
+
+def run_async(args):
+    """
+    Runs the CAN buses, the UDS polling and the gamepad output on one asyncio event loop
+    instead of one thread per bus, a polling thread and an output thread.
+    """
+    import asyncio
+
+    event_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(event_loop)
+    start(args, event_loop=event_loop)
+    event_loop.run_forever()
+    restart_if_requested()
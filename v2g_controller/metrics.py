@@ -0,0 +1,227 @@
+import json
+import os
+import socketserver
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Upper bounds of the histogram buckets in seconds, 1 us to 10 s
+BUCKETS = tuple(
+    factor * 10.0 ** exponent
+    for exponent in range(-6, 1)
+    for factor in (1.0, 2.0, 5.0)
+) + (10.0,)
+
+
+class Histogram:
+    """
+    Histogram of durations with fixed, preallocated buckets.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound of the bucket containing the given fraction of all values.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    Counters and histograms of the CAN to gamepad pipeline.
+
+    Instrumented components hold a reference to a Metrics object or None,
+    so there is no overhead except a None check when metrics are disabled.
+    Counters are updated without locking from the CAN reader threads and
+    may miss single increments under concurrent updates.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        # (bus channel, CAN ID) -> received frames
+        self.frames = {}
+        # reason -> dropped frames
+        self.dropped = {}
+        # signal name -> decode time
+        self.decode = {}
+        self.reports = 0
+        # CAN timestamp of the decoded frame to report sent
+        self.latency = Histogram()
+        # time base of the CAN timestamps, replaced when replaying logs
+        self.clock = time.time
+        # startup.StartupTimer of the process or None
+        self.startup = None
+        # time spent sending a report to the gamepad
+        self.report_send = Histogram()
+        # main loop source -> duration of its callbacks, e.g. in Bluetooth mode
+        self.loop = {}
+
+    def frame(self, msg):
+        key = (msg.channel, msg.arbitration_id)
+        self.frames[key] = self.frames.get(key, 0) + 1
+
+    def drop(self, reason):
+        self.dropped[reason] = self.dropped.get(reason, 0) + 1
+
+    def decoded(self, name, duration):
+        histogram = self.decode.get(name)
+        if histogram is None:
+            histogram = self.decode[name] = Histogram()
+        histogram.observe(duration)
+
+    def loop_iteration(self, name, duration):
+        histogram = self.loop.get(name)
+        if histogram is None:
+            histogram = self.loop[name] = Histogram()
+        histogram.observe(duration)
+
+    def report(self, source_time):
+        self.reports += 1
+        if source_time is not None:
+            self.latency.observe(self.clock() - source_time)
+
+    def snapshot(self):
+        """
+        Returns all metrics as a JSON serializable dict.
+        """
+        uptime = time.time() - self.started
+        return {
+            "uptime": uptime,
+            "frames": [
+                {"bus": str(channel), "id": hex(can_id), "count": count}
+                for (channel, can_id), count in sorted(self.frames.copy().items(), key=lambda item: (str(item[0][0]), item[0][1]))
+            ],
+            "dropped": self.dropped.copy(),
+            "decode": {name: histogram.summary() for name, histogram in self.decode.copy().items()},
+            "reports": self.reports,
+            "report_rate": self.reports / uptime if uptime > 0 else 0.0,
+            "latency": self.latency.summary(),
+            "report_send": self.report_send.summary(),
+            "loop": {name: histogram.summary() for name, histogram in self.loop.copy().items()},
+            "startup": dict(self.startup.marks) if self.startup is not None else {},
+        }
+
+    def format_summary(self):
+        """
+        Returns a human readable summary of the metrics.
+        """
+        snapshot = self.snapshot()
+        frames = sum(entry["count"] for entry in snapshot["frames"])
+        lines = [
+            f"Metrics after {snapshot['uptime']:.0f} s: {frames} frames, "
+            f"{snapshot['reports']} reports ({snapshot['report_rate']:.1f}/s), "
+            f"dropped: {snapshot['dropped']}",
+            f"  latency: {_format_histogram(snapshot['latency'])}",
+            f"  report send: {_format_histogram(snapshot['report_send'])}",
+        ]
+        if self.startup is not None:
+            lines.append(f"  {self.startup.format_summary()}")
+        for entry in snapshot["frames"]:
+            lines.append(f"  bus {entry['bus']} {entry['id']}: {entry['count']} frames")
+        for name, summary in snapshot["decode"].items():
+            lines.append(f"  decode {name}: {_format_histogram(summary)}")
+        for name, summary in snapshot["loop"].items():
+            lines.append(f"  main loop {name}: {_format_histogram(summary)}")
+        return "\n".join(lines)
+
+
+def _format_histogram(summary):
+    return (
+        f"n={summary['count']} mean={summary['mean'] * 1e6:.0f}us "
+        f"p50<={summary['p50'] * 1e6:.0f}us p99<={summary['p99'] * 1e6:.0f}us "
+        f"max={summary['max'] * 1e6:.0f}us"
+    )
+
+
+class SummaryThread(threading.Thread):
+    """
+    Prints the summary of metrics periodically.
+
+    Args:
+    metrics: Object with a format_summary() method, e.g. Metrics.
+    interval: Time in seconds between two summaries.
+    """
+
+    def __init__(self, metrics, interval):
+        super().__init__(name="v2g-metrics", daemon=True)
+        self.metrics = metrics
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            print("\n" + self.metrics.format_summary())
+
+
+def serve(metrics: Metrics, endpoint):
+    """
+    Serves the metrics as JSON on a local endpoint in a background thread.
+
+    Args:
+    metrics: The metrics to serve.
+    endpoint: "<host>:<port>" for HTTP (GET /metrics) or "unix:<path>" for
+              a Unix socket that returns the metrics on every connection.
+    """
+    if endpoint.startswith("unix:"):
+        path = endpoint[len("unix:"):]
+
+        class UnixHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.wfile.write(json.dumps(metrics.snapshot()).encode() + b"\n")
+
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socketserver.ThreadingUnixStreamServer(path, UnixHandler)
+    else:
+        host, _, port = endpoint.rpartition(":")
+
+        class HTTPHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(metrics.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), HTTPHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="v2g-metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,220 @@
+import threading
+import time
+
+from v2g_controller.gamepads.report_aggregator import ReportAggregator
+
+
+class OutputThread(threading.Thread):
+    """
+    Thread that owns the gamepad and sends the reports collected by a ReportAggregator.
+
+    The CAN reader threads only decode frames and update the aggregator.
+    The output thread is woken by the first update after a report and sends
+    at most one report per tick, so a slow gamepad update does not stall the
+    reception of CAN frames.
+    """
+
+    def __init__(self, aggregator: ReportAggregator):
+        super().__init__(name="v2g-output", daemon=True)
+        self.aggregator = aggregator
+        self.wakeup = threading.Event()
+        self.running = True
+        aggregator.on_update = self.notify
+        self.connector = None
+        # time (of the frame timestamps) at which a held back value of the connector is due, or None
+        self.pending_at = None
+
+    def watch(self, connector):
+        """
+        Applies the values the rate limiters of a CarConnector hold back once they are due,
+        also when no further frame arrives.
+        """
+        self.connector = connector
+        connector.on_pending = self.notify_pending
+
+    def notify(self):
+        """
+        Wakes the output thread, called by the aggregator on every update.
+        """
+        if not self.wakeup.is_set():
+            self.wakeup.set()
+
+    def notify_pending(self, due):
+        """
+        Wakes the output thread at the given time, called by the connector for held back values.
+        """
+        if self.pending_at is None or due < self.pending_at:
+            self.pending_at = due
+            self.wakeup.set()
+
+    def run(self):
+        aggregator = self.aggregator
+        while self.running:
+            pending_at = self.pending_at
+            self.wakeup.wait(None if pending_at is None else max(0.0, pending_at - time.time()))
+            self.wakeup.clear()
+            if pending_at is not None and time.time() >= pending_at:
+                # reset first, values held back during apply_pending() set it again
+                self.pending_at = None
+                self.connector.apply_pending()
+            if aggregator.last_flush is not None:
+                delay = aggregator.last_flush + aggregator.tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            aggregator.flush(time.monotonic())
+
+    def stop(self, timeout=1.0):
+        """
+        Stops the thread and waits until a report being sent is complete.
+        """
+        self.running = False
+        self.wakeup.set()
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout)
+
+
+class GLibOutput:
+    """
+    Sends the reports collected by a ReportAggregator from the GLib main loop.
+
+    Used in Bluetooth mode, where the HID sockets are served by the GLib main
+    loop. Updates schedule a flush on the main loop, which sends at most one
+    report per tick.
+    """
+
+    def __init__(self, aggregator: ReportAggregator):
+        from gi.repository import GLib
+
+        self.glib = GLib
+        self.aggregator = aggregator
+        self.scheduled = False
+        aggregator.on_update = self.notify
+        self.connector = None
+        # scheduled apply_pending() of the connector and its time
+        self.pending = None
+        self.pending_at = None
+
+    def watch(self, connector):
+        """
+        Applies the values the rate limiters of a CarConnector hold back once they are due,
+        also when no further frame arrives.
+        """
+        self.connector = connector
+        connector.on_pending = self.notify_pending
+
+    def notify_pending(self, due):
+        """
+        Schedules apply_pending() of the connector at the given time.
+        """
+        if self.pending is not None:
+            if due >= self.pending_at:
+                return
+            self.glib.source_remove(self.pending)
+        self.pending_at = due
+        self.pending = self.glib.timeout_add(max(1, int((due - time.time()) * 1000) + 1), self._apply_pending)
+
+    def _apply_pending(self):
+        self.pending = None
+        self.connector.apply_pending()
+        return False
+
+    def notify(self):
+        """
+        Schedules a flush on the main loop, called by the aggregator on every update.
+        """
+        if not self.scheduled:
+            self.scheduled = True
+            self.glib.idle_add(self._on_idle)
+
+    def _on_idle(self):
+        aggregator = self.aggregator
+        if aggregator.last_flush is not None:
+            delay = aggregator.last_flush + aggregator.tick - time.monotonic()
+            if delay > 0:
+                self.glib.timeout_add(max(1, int(delay * 1000)), self._flush)
+                return False
+        self._flush()
+        return False
+
+    def _flush(self):
+        # clear first, updates arriving during the flush schedule the next one
+        self.scheduled = False
+        self.aggregator.flush(time.monotonic())
+        return False
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class AsyncioOutput:
+    """
+    Sends the reports collected by a ReportAggregator from an asyncio event loop.
+
+    Used by the asyncio runtime, where the CAN frames are decoded on the
+    event loop. Updates schedule a flush on the loop, which sends at most one
+    report per tick.
+    """
+
+    def __init__(self, aggregator: ReportAggregator, loop):
+        self.loop = loop
+        self.aggregator = aggregator
+        self.scheduled = False
+        aggregator.on_update = self.notify
+        self.connector = None
+        # scheduled apply_pending() of the connector and its time
+        self.pending = None
+        self.pending_at = None
+
+    def watch(self, connector):
+        """
+        Applies the values the rate limiters of a CarConnector hold back once they are due,
+        also when no further frame arrives.
+        """
+        self.connector = connector
+        connector.on_pending = self.notify_pending
+
+    def notify_pending(self, due):
+        """
+        Schedules apply_pending() of the connector at the given time.
+        """
+        if self.pending is not None:
+            if due >= self.pending_at:
+                return
+            self.pending.cancel()
+        self.pending_at = due
+        self.pending = self.loop.call_later(max(0.0, due - time.time()), self._apply_pending)
+
+    def _apply_pending(self):
+        self.pending = None
+        self.connector.apply_pending()
+
+    def notify(self):
+        """
+        Schedules a flush on the event loop, called by the aggregator on every update.
+        """
+        if not self.scheduled:
+            self.scheduled = True
+            self.loop.call_soon(self._on_idle)
+
+    def _on_idle(self):
+        aggregator = self.aggregator
+        if aggregator.last_flush is not None:
+            delay = aggregator.last_flush + aggregator.tick - time.monotonic()
+            if delay > 0:
+                self.loop.call_later(delay, self._flush)
+                return
+        self._flush()
+
+    def _flush(self):
+        # clear first, updates arriving during the flush schedule the next one
+        self.scheduled = False
+        self.aggregator.flush(time.monotonic())
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
@@ -0,0 +1,57 @@
+import v2g_controller.configuration_helper as cfh
+
+
+class SignalRateLimiter:
+    """
+    Limits how often a single signal configuration is decoded.
+
+    Frames are admitted at most once per 1 / max_rate seconds, based on the
+    timestamps of the CAN messages. With RatePolicy.Latest, the latest dropped
+    frame is kept and handed out by take_due() once the interval has passed,
+    so the final value of a signal is never lost. With RatePolicy.Edges,
+    frames whose signal bytes differ from the last admitted frame are always
+    admitted, so button presses and gear changes cannot be skipped.
+    """
+
+    def __init__(self, config: cfh.SignalConfiguration, max_rate):
+        self.config = config
+        self.min_interval = 1.0 / max_rate
+        self.edges = config.rate_policy == cfh.RatePolicy.Edges
+        self.next_time = 0.0
+        self.last_raw = None
+        self.pending = None
+
+    def admit(self, payload, now) -> bool:
+        """
+        Returns True if the payload should be decoded now.
+
+        Args:
+        payload: The CAN frame payload or UDS response data containing the signal.
+        now: Timestamp of the message in seconds.
+        """
+        if self.edges:
+            raw = self.config.raw(payload)
+            if raw != self.last_raw:
+                self.last_raw = bytes(raw) if isinstance(raw, memoryview) else raw
+                self.next_time = now + self.min_interval
+                return True
+        # also restart on timestamps jumping backwards, e.g. when replaying logs
+        if now >= self.next_time or now < self.next_time - self.min_interval:
+            self.next_time = now + self.min_interval
+            self.pending = None
+            return True
+        if not self.edges:
+            # views of reassembled UDS responses are only valid during the call
+            self.pending = bytes(payload) if isinstance(payload, memoryview) else payload
+        return False
+
+    def take_due(self, now):
+        """
+        Returns the payload of the latest dropped message if its interval has passed, else None.
+        """
+        payload = self.pending
+        if payload is None or now < self.next_time:
+            return None
+        self.pending = None
+        self.next_time = now + self.min_interval
+        return payload
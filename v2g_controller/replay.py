@@ -0,0 +1,116 @@
+import sys
+import time
+
+import can
+
+import v2g_controller.configuration_helper as cfh
+import v2g_controller.helper as h
+from v2g_controller.helper import debug
+from v2g_controller.car_connector import CarConnector
+from v2g_controller.isotp import IsoTpListener
+from v2g_controller.metrics import Metrics
+from v2g_controller.gamepads.recorder.recorder import ReportRecorder
+
+
+class Replay:
+    """
+    Feeds recorded CAN traffic through the complete decoding pipeline.
+
+    Messages are read with python-can's LogReader (e.g. .asc, .blf, candump .log)
+    and passed to a CarConnector. Reports are sent inline, paced by the
+    timestamps of the log, so the reports produced for a log are
+    reproducible regardless of the playback speed.
+    """
+
+    def __init__(self, connector: CarConnector, speed=1.0, transport: IsoTpListener = None):
+        """
+        Args:
+        connector: The connector to feed the messages to.
+        speed: Playback speed, 1.0 for real time, 0 for as fast as possible.
+        transport: Reassembles the recorded UDS responses for the connector, or None.
+        """
+        self.connector = connector
+        self.transport = transport
+        self.speed = speed
+        self.timestamp = 0.0
+        self.frames = 0
+        self.duration = 0.0
+
+    def clock(self):
+        """
+        Returns the timestamp of the last replayed message.
+        """
+        return self.timestamp
+
+    def run(self, path):
+        connector = self.connector
+        transport = self.transport
+        first_timestamp = None
+        start = time.perf_counter()
+        for msg in can.LogReader(path):
+            if msg.is_error_frame or msg.is_remote_frame:
+                continue
+            if first_timestamp is None:
+                first_timestamp = msg.timestamp
+            if self.speed > 0:
+                delay = (msg.timestamp - first_timestamp) / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            self.timestamp = msg.timestamp
+            connector.on_message_received(msg)
+            if transport is not None:
+                transport.on_message_received(msg)
+            self.frames += 1
+        if connector.pending_limiters:
+            # the values held back at the end of the log are applied as the runtime would do
+            connector.apply_pending(max(limiter.next_time for limiter in connector.pending_limiters))
+        if connector.aggregator is not None:
+            connector.aggregator.flush(self.timestamp)
+        self.duration = time.perf_counter() - start
+
+
+def start(args):
+    """
+    Replays the log given by args.replay with the selected vehicle configuration.
+    """
+    import v2g_controller.vehicle_manifest as vehicle_manifest
+    from v2g_controller.uds_poller import response_channels
+
+    if args.debug:
+        h.debug_enabled = True
+    vehicle_configuration: cfh.VehicleConfiguration = vehicle_manifest.load(args.vehicle)
+    if vehicle_configuration is None:
+        print("Error: Selected Vehicle is not configured!")
+        sys.exit(1)
+
+    output = open(args.record, "w") if args.record else None
+    recorder = ReportRecorder(output)
+    replay_metrics = Metrics() if args.metrics else None
+    connector = CarConnector(
+        gamepad=recorder,
+        vehicle_config=vehicle_configuration,
+        linear_dispatch=args.linear_dispatch,
+        output_tick=args.output_tick if args.output_tick >= 0 else None,
+        metrics=replay_metrics,
+    )
+    transport = None
+    if vehicle_configuration.operation_mode == cfh.OperationMode.UDS:
+        # the flow control frames are part of the log, nothing is sent
+        transport = IsoTpListener(None, response_channels(vehicle_configuration.polling_messages), connector.on_pdu)
+    replay = Replay(connector, args.replay_speed, transport)
+    recorder.clock = replay.clock
+    if replay_metrics is not None:
+        replay_metrics.clock = replay.clock
+    debug(f"Replaying {args.replay} for {args.vehicle} ...")
+    try:
+        replay.run(args.replay)
+    finally:
+        if output is not None:
+            output.close()
+    rate = replay.frames / replay.duration if replay.duration > 0 else 0.0
+    print(
+        f"Replayed {replay.frames} frames in {replay.duration:.3f} s ({rate:.0f} frames/s), "
+        f"{recorder.reports} reports"
+    )
+    if replay_metrics is not None:
+        print(replay_metrics.format_summary())
@@ -0,0 +1,51 @@
+import os
+import time
+
+from v2g_controller.helper import debug
+
+
+def _process_age():
+    """
+    Returns the time in seconds since the process was started, including the
+    interpreter startup, or None if the start time is unknown.
+    """
+    try:
+        with open("/proc/self/stat") as stat:
+            # the process name may contain spaces, the fields after it are separated by spaces
+            fields = stat.read().rpartition(")")[2].split()
+        with open("/proc/uptime") as uptime:
+            system_uptime = float(uptime.read().split()[0])
+        return system_uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer:
+    """
+    Records the time of startup steps, from process start to the first report.
+
+    Every mark is recorded only once, so marks may be placed in code paths
+    that are executed repeatedly.
+    """
+
+    def __init__(self):
+        age = _process_age()
+        # process start in time.monotonic() time base
+        self.started = time.monotonic() - (age if age is not None and age >= 0 else 0.0)
+        self.marks = {}
+
+    def mark(self, name):
+        if name not in self.marks:
+            self.marks[name] = time.monotonic() - self.started
+            debug(f"Startup: {name} after {self.marks[name] * 1000:.0f} ms")
+
+    def format_summary(self):
+        """
+        Returns the startup steps with the time since process start.
+        """
+        return "Startup: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.marks.items())
+
+
+# Startup timer of the process, modules may be imported before it is used
+timer = StartupTimer()
+mark = timer.mark
@@ -0,0 +1,399 @@
+import threading
+import time
+
+import can
+
+from v2g_controller.configuration_helper import PollingMessage
+from v2g_controller.helper import debug
+from v2g_controller.isotp import IsoTpListener
+
+# UDS service IDs
+READ_DATA_BY_IDENTIFIER = 0x22
+NEGATIVE_RESPONSE = 0x7F
+# negative response code: the ECU needs more time
+RESPONSE_PENDING = 0x78
+POSITIVE_RESPONSE_OFFSET = 0x40
+# DIDs per batched request, limited by the single frame request
+MAX_BATCH = 3
+PADDING = 0x55
+
+
+class PollRequest:
+    """
+    State of a single polling message.
+    """
+
+    def __init__(self, polling_message: PollingMessage, order):
+        message = polling_message.message
+        self.message = message
+        self.ecu = message.arbitration_id
+        self.response_id = polling_message.response_id
+        self.interval = polling_message.interval
+        self.priority = polling_message.priority
+        self.order = order
+        # UDS request without the ISO-TP single frame header
+        request = bytes(message.data[1 : 1 + (message.data[0] & 0x0F)])
+        self.service = request[0]
+        # a positive response repeats the DID (0x22) or the sub-function (e.g. 0x10)
+        parameters = 2 if self.service == READ_DATA_BY_IDENTIFIER else 1
+        self.response_prefix = bytes([self.service + POSITIVE_RESPONSE_OFFSET]) + request[1 : 1 + parameters]
+        self.name = f"{self.ecu:#x}:{request[: 1 + parameters].hex()}"
+        self.did = request[1:3] if self.service == READ_DATA_BY_IDENTIFIER else None
+        # data length of the DID, learned from the responses
+        self.data_length = None
+        self.next_due = 0.0
+        self.sent_at = None
+        self.first_sent = None
+        self.responses = 0
+        self.negative = 0
+        self.timeouts = 0
+        self.latency = 0.0
+
+    def batchable(self):
+        return self.did is not None and self.response_id is not None and self.data_length is not None
+
+
+class BatchRequest:
+    """
+    Several ReadDataByIdentifier requests to one ECU, sent as a single request.
+    """
+
+    def __init__(self, requests):
+        first = requests[0]
+        self.ecu = first.ecu
+        self.response_id = first.response_id
+        self.requests = requests
+        request = bytes([READ_DATA_BY_IDENTIFIER]) + b"".join(request.did for request in requests)
+        self.message = can.Message(
+            arbitration_id=self.ecu,
+            data=bytes([len(request)]) + request + bytes([PADDING]) * (7 - len(request)),
+            is_extended_id=first.message.is_extended_id,
+        )
+        self.service = READ_DATA_BY_IDENTIFIER
+        self.response_prefix = bytes([READ_DATA_BY_IDENTIFIER + POSITIVE_RESPONSE_OFFSET]) + first.did
+        self.name = f"{self.ecu:#x}:22" + "+".join(request.did.hex() for request in requests)
+        self.sent_at = None
+
+
+def response_channels(polling_messages):
+    """
+    Returns the ISO-TP channels of the polling messages, as dict of response ID -> (request ID, is_extended_id).
+    """
+    channels = {}
+    for polling_message in polling_messages:
+        if polling_message.response_id is not None and polling_message.response_id not in channels:
+            message = polling_message.message
+            channels[polling_message.response_id] = (message.arbitration_id, message.is_extended_id)
+    return channels
+
+
+def uds_payload(data):
+    """
+    Returns the UDS payload of an ISO-TP single frame or the start of a first frame, else None.
+    """
+    frame_type = data[0] >> 4
+    if frame_type == 0:
+        return data[1 : 1 + (data[0] & 0x0F)]
+    if frame_type == 1:
+        return data[2:]
+    return None
+
+
+class UDSPoller(can.Listener):
+    """
+    Sends the UDS polling messages, paced by the responses of the ECUs.
+
+    At most one request per ECU is outstanding. The next request to an ECU is
+    sent as soon as the response to the previous one arrived (matched by the
+    response ID and the service and DID of the response) or timed out. Among
+    the requests that are due, the one with the lowest priority value is sent
+    first, unless a request is overdue by at least its own interval or the
+    response timeout: then the longest overdue request is sent first, so a
+    request whose round trip exceeds its interval cannot starve the other
+    requests to the ECU.
+    polling_interval of a message is the minimum time between two of its
+    requests.
+
+    Responses on the response IDs of the polling messages are reassembled by
+    ISO-TP receivers, which send the flow control frames, and positive
+    ReadDataByIdentifier responses are passed to the sink per DID.
+
+    With batching, due ReadDataByIdentifier requests to the same ECU are
+    combined into one request once the data lengths of their DIDs are known
+    from single responses. The response is split by these lengths. If the ECU
+    rejects or does not answer a batched request, batching is disabled for it.
+
+    service(now) performs one scheduling step and can be driven by any loop;
+    start() runs it in a background thread, run_async() as a coroutine.
+    """
+
+    def __init__(self, bus, polling_messages, timeout=0.1, batching=False, sink=None):
+        """
+        Args:
+        bus: The bus to send the requests on.
+        polling_messages: List of PollingMessage.
+        timeout: Time in seconds to wait for a response.
+        batching: Combine requests to the same ECU.
+        sink: Receives the DID data of the responses via on_uds_response(), e.g. the CarConnector.
+        """
+        self.bus = bus
+        self.timeout = timeout
+        self.sink = sink
+        self.requests = [PollRequest(polling_message, order) for order, polling_message in enumerate(polling_messages)]
+        # ECU -> requests, in sending preference
+        self.ecus = {}
+        for request in self.requests:
+            self.ecus.setdefault(request.ecu, []).append(request)
+        for requests in self.ecus.values():
+            requests.sort(key=lambda request: (request.priority, request.order))
+        # ECU -> outstanding PollRequest or BatchRequest or None
+        self.outstanding = {ecu: None for ecu in self.ecus}
+        # response ID -> ECUs, requests without response ID match any ID
+        self.response_ecus = {}
+        self.unbound_ecus = []
+        for request in self.requests:
+            if request.response_id is None:
+                if request.ecu not in self.unbound_ecus:
+                    self.unbound_ecus.append(request.ecu)
+                continue
+            ecus = self.response_ecus.setdefault(request.response_id, [])
+            if request.ecu not in ecus:
+                ecus.append(request.ecu)
+        # ISO-TP receivers per response ID, sending flow control frames to the ECU
+        self.transport = IsoTpListener(bus, response_channels(polling_messages), self.on_response)
+        # ECUs for which requests are batched
+        self.batching = set(self.ecus) if batching else set()
+        self.batches = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        self.send_errors = 0
+
+    def on_message_received(self, msg: can.Message):
+        if msg.arbitration_id in self.response_ecus:
+            # calls on_response() for complete messages
+            self.transport.on_message_received(msg)
+        elif self.unbound_ecus:
+            payload = uds_payload(msg.data)
+            if payload:
+                self._match(self.unbound_ecus, payload)
+
+    def on_response(self, response_id, payload, msg: can.Message):
+        """
+        Handles a reassembled response and passes its DID data to the sink.
+        """
+        responses = self._match(self.response_ecus[response_id], payload)
+        if self.sink is None or payload[0] != READ_DATA_BY_IDENTIFIER + POSITIVE_RESPONSE_OFFSET or len(payload) < 3:
+            return
+        if responses is not None:
+            for did, data in responses:
+                self.sink.on_uds_response(response_id, did, data, msg)
+        else:
+            self.sink.on_uds_response(response_id, (payload[1] << 8) | payload[2], payload[3:], msg)
+
+    def _match(self, ecus, payload):
+        """
+        Completes the outstanding request answered by the payload.
+
+        Returns:
+        The (DID, data) pairs if the payload answers a BatchRequest, else None.
+        """
+        now = time.monotonic()
+        with self.lock:
+            for ecu in ecus:
+                outstanding = self.outstanding[ecu]
+                if outstanding is None:
+                    continue
+                responses = None
+                if payload[0] == NEGATIVE_RESPONSE and len(payload) >= 3 and payload[1] == outstanding.service:
+                    if payload[2] == RESPONSE_PENDING:
+                        outstanding.sent_at = now
+                        return None
+                    if isinstance(outstanding, BatchRequest):
+                        self._batch_failed(outstanding, f"negative response {payload[2]:#x}")
+                    else:
+                        outstanding.negative += 1
+                elif payload[: len(outstanding.response_prefix)] == outstanding.response_prefix:
+                    if isinstance(outstanding, BatchRequest):
+                        responses = self._split(outstanding, payload)
+                        if responses is None:
+                            self._batch_failed(outstanding, "unexpected response")
+                        else:
+                            for request in outstanding.requests:
+                                request.responses += 1
+                                request.latency += now - outstanding.sent_at
+                    else:
+                        outstanding.responses += 1
+                        outstanding.latency += now - outstanding.sent_at
+                        if outstanding.did is not None:
+                            outstanding.data_length = len(payload) - 3
+                else:
+                    continue
+                self.outstanding[ecu] = None
+                self.wakeup.set()
+                return responses
+        return None
+
+    def _split(self, batch: BatchRequest, payload):
+        """
+        Splits a batched response into (DID, data) pairs, None if the response is malformed.
+        The data are memoryviews of the payload.
+        """
+        requests = {request.did: request for request in batch.requests}
+        responses = []
+        position = 1
+        while position < len(payload):
+            request = requests.get(bytes(payload[position : position + 2]))
+            if request is None or position + 2 + request.data_length > len(payload):
+                return None
+            data = payload[position + 2 : position + 2 + request.data_length]
+            responses.append(((payload[position] << 8) | payload[position + 1], data))
+            position += 2 + request.data_length
+        return responses
+
+    def _batch_failed(self, batch: BatchRequest, reason):
+        debug(f"Batched UDS request {batch.name} failed ({reason}), requesting DIDs of {batch.ecu:#x} separately")
+        self.batching.discard(batch.ecu)
+
+    def _send(self, outstanding, requests, now):
+        try:
+            self.bus.send(outstanding.message)
+        except can.CanError as error:
+            self.send_errors += 1
+            debug(f"Sending UDS request {outstanding.name} failed: {error}")
+        outstanding.sent_at = now
+        for request in requests:
+            if request.first_sent is None:
+                request.first_sent = now
+            request.next_due = now + request.interval
+        self.outstanding[outstanding.ecu] = outstanding
+
+    def _next(self, ecu, requests, now):
+        """
+        Sends the next due request to an idle ECU, returns False if no request is due.
+        """
+        due = None
+        # a request overdue by at least its interval (at most one response timeout) is sent first,
+        # the longest overdue one, so requests behind a higher priority request that is always due are not starved
+        aged = None
+        for request in requests:
+            if request.next_due > now:
+                continue
+            if due is None:
+                due = request
+            overdue = now - request.next_due
+            if overdue >= min(request.interval, self.timeout) and (aged is None or overdue > now - aged.next_due):
+                aged = request
+        if due is None:
+            return False
+        if aged is not None:
+            due = aged
+        if ecu in self.batching and due.batchable():
+            # also request DIDs that would be due soon
+            batch = [due] + [
+                request
+                for request in requests
+                if request is not due and request.batchable() and request.next_due <= now + request.interval / 2
+            ][: MAX_BATCH - 1]
+            if len(batch) > 1:
+                self.batches += 1
+                self._send(BatchRequest(batch), batch, now)
+                return True
+        self._send(due, [due], now)
+        return True
+
+    def service(self, now):
+        """
+        Handles timeouts and sends the due requests to idle ECUs.
+
+        Returns:
+        The time at which service() should be called next, unless a response arrives before.
+        """
+        deadline = now + 1.0
+        with self.lock:
+            for ecu, requests in self.ecus.items():
+                outstanding = self.outstanding[ecu]
+                if outstanding is not None and now - outstanding.sent_at >= self.timeout:
+                    if isinstance(outstanding, BatchRequest):
+                        self._batch_failed(outstanding, "timeout")
+                    else:
+                        outstanding.timeouts += 1
+                    self.outstanding[ecu] = None
+                    outstanding = None
+                if outstanding is None and not self._next(ecu, requests, now):
+                    deadline = min(deadline, min(request.next_due for request in requests))
+                outstanding = self.outstanding[ecu]
+                if outstanding is not None:
+                    deadline = min(deadline, outstanding.sent_at + self.timeout)
+        return deadline
+
+    def run(self):
+        while self.running:
+            now = time.monotonic()
+            deadline = self.service(now)
+            self.wakeup.wait(max(0.0, deadline - time.monotonic()))
+            self.wakeup.clear()
+
+    async def run_async(self):
+        """
+        Runs the polling on an asyncio event loop, the responses have to be received on the same loop.
+        """
+        import asyncio
+
+        self.wakeup = asyncio.Event()
+        self.running = True
+        while self.running:
+            deadline = self.service(time.monotonic())
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="v2g-uds-poller", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        """
+        Stops the polling, waits for the thread started by start() to finish.
+        """
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def statistics(self, now=None):
+        """
+        Returns the achieved refresh rate, latency, timeouts and negative responses per request.
+        """
+        now = time.monotonic() if now is None else now
+        statistics = {}
+        for request in self.requests:
+            elapsed = now - request.first_sent if request.first_sent is not None else 0.0
+            statistics[request.name] = {
+                "responses": request.responses,
+                "rate": request.responses / elapsed if elapsed > 0 else 0.0,
+                "latency": request.latency / request.responses if request.responses else 0.0,
+                "timeouts": request.timeouts,
+                "negative": request.negative,
+            }
+        return statistics
+
+    def format_summary(self):
+        lines = ["UDS polling:"]
+        for name, statistics in self.statistics().items():
+            lines.append(
+                f"  {name}: {statistics['rate']:.1f}/s, latency {statistics['latency'] * 1e3:.1f} ms, "
+                f"{statistics['timeouts']} timeouts, {statistics['negative']} negative"
+            )
+        if self.batches:
+            lines.append(f"  {self.batches} batched requests")
+        transport = self.transport.statistics()
+        if transport["multi_frame"] or transport["aborted"]:
+            lines.append(f"  {transport['multi_frame']} multi-frame responses, {transport['aborted']} aborted")
+        if self.send_errors:
+            lines.append(f"  {self.send_errors} send errors")
+        return "\n".join(lines)
@@ -0,0 +1,143 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import can
+
+import v2g_controller.vehicle_manifest as vehicle_manifest
+from v2g_controller.helper import debug, cache_dir
+
+
+def _path():
+    return os.path.join(cache_dir(), "last_vehicle.json")
+
+
+def _buses(manifest):
+    return [[bus.type, bus.bitrate, bus.data_bitrate] for bus in manifest.can_buses]
+
+
+def save(vehicle, fingerprint):
+    """
+    Stores the detected vehicle, its fingerprint and CAN buses.
+
+    Args:
+    vehicle: The detected vehicle.
+    fingerprint: The CAN IDs received during the detection, see car_detector.detect_vehicle().
+    """
+    manifest = vehicle_manifest.manifests().get(vehicle)
+    if manifest is None or not manifest.auto_detect_ids or not set(manifest.auto_detect_ids) <= set(fingerprint):
+        return
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        temporary = f"{_path()}.{os.getpid()}.tmp"
+        with open(temporary, "w") as cache_file:
+            json.dump(
+                {"vehicle": vehicle, "fingerprint": sorted(fingerprint), "can_buses": _buses(manifest)},
+                cache_file,
+            )
+        os.replace(temporary, _path())
+    except OSError as error:
+        debug(f"Could not store the detected vehicle: {error}")
+
+
+def load():
+    """
+    Returns (vehicle, fingerprint) of the last detected vehicle, or None if there is
+    no cached vehicle or its configuration has changed since.
+    """
+    try:
+        with open(_path()) as cache_file:
+            cached = json.load(cache_file)
+        vehicle = cached["vehicle"]
+        fingerprint = cached["fingerprint"]
+        can_buses = cached["can_buses"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    manifest = vehicle_manifest.manifests().get(vehicle)
+    if (
+        manifest is None
+        or not manifest.auto_detect_ids
+        or not set(manifest.auto_detect_ids) <= set(fingerprint)
+        or _buses(manifest) != can_buses
+    ):
+        debug(f"Cached vehicle {vehicle} does not match its configuration anymore")
+        return None
+    return vehicle, fingerprint
+
+
+def clear():
+    try:
+        os.remove(_path())
+    except OSError:
+        pass
+
+
+def restart():
+    """
+    Restarts the process with the same arguments.
+    Must be called from the main thread once the buses are closed, see main.restart_if_requested().
+    """
+    sys.stdout.flush()
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+class VehicleVerifier(can.Listener):
+    """
+    Verifies a cached vehicle in the background, while the vehicle is already running.
+
+    Collects the IDs received on bus 0. The cached vehicle is confirmed as
+    soon as all fingerprint IDs were seen. If IDs are still missing when the
+    verification time after start() has passed, including on a silent bus
+    (e.g. because the bus only accepts the IDs of the cached vehicle), the
+    cache is cleared and on_mismatch is called from the verification thread,
+    e.g. main.request_restart() to restart the process with full
+    auto-detection.
+    """
+
+    def __init__(self, vehicle, fingerprint, duration=2.0, on_done=None, on_mismatch=None):
+        """
+        Args:
+        vehicle: The cached vehicle.
+        fingerprint: CAN IDs that have to be received.
+        duration: Verification time in seconds, starting with start().
+        on_done: Called without arguments when verification completes, e.g. to reset the CAN filters.
+        on_mismatch: Called without arguments if the fingerprint does not match.
+        """
+        self.vehicle = vehicle
+        self.missing = set(fingerprint)
+        self.duration = duration
+        self.on_done = on_done
+        self.on_mismatch = on_mismatch
+        self.started = None
+        self.done = threading.Event()
+        self.matched = None
+
+    def start(self):
+        """
+        Starts the verification time, call once the verifier receives the frames of bus 0.
+        """
+        self.started = time.monotonic()
+        threading.Thread(target=self._finish, name="v2g-verify", daemon=True).start()
+
+    def on_message_received(self, msg: can.Message):
+        if self.done.is_set():
+            return
+        self.missing.discard(msg.arbitration_id)
+        if not self.missing:
+            self.done.set()
+
+    def _finish(self):
+        self.done.wait(self.duration)
+        self.done.set()
+        self.matched = not self.missing
+        if self.on_done is not None:
+            self.on_done()
+        if self.matched:
+            debug(f"Cached vehicle {self.vehicle} verified")
+            return
+        print(f"Cached vehicle {self.vehicle} not verified, missing IDs: {[hex(can_id) for can_id in sorted(self.missing)]}")
+        clear()
+        if self.on_mismatch is not None:
+            self.on_mismatch()
@@ -36,6 +36,7 @@ config_internal = VehicleConfiguration(
                 ),
             ),
             type=Type.Steering,
+            bus=0, # CAN FD payload, only received on the FD bus
         ),
         SignalConfiguration(
             id=1,
@@ -47,6 +48,7 @@ config_internal = VehicleConfiguration(
                 mapping=(lambda x: int((100 * (x[0] - 0x25)) / 0xB5)),
             ),
             type=Type.Speed,
+            bus=0,
         ),
         SignalConfiguration(
             id=2,
@@ -96,6 +98,7 @@ config_uds = VehicleConfiguration(
     operation_mode=OperationMode.UDS,
     can_buses=[CANBus("standard", 500000)],
     auto_detect_ids=[0x77c, 0x77d, 0x7a5,0x776],
+    uds_batching=True, # gear and buttons of 0x70C are read in one request
     steering_max=0.15,
     steering_deadzone=0.1,
     steering_exponent=1.0,
@@ -105,68 +108,70 @@ config_uds = VehicleConfiguration(
             name="steering",
             can_signal=CANSignal(
                 id=0x77C,
-                byte=5,
+                byte=1,
                 length=2,
                 mapping=lambda x: -range_map(
                     ((x[0] << 8) + x[1]), 0x0000, 0x2EDF, -1.0, 1.0
                 ),
             ),
             type=Type.Steering,
+            did=0x1812,
         ),
         SignalConfiguration(
             1,
             "speed",
             CANSignal(
-                0x77D, 5, 1, mapping=(lambda x: int((100 * (x[0] - 0x25)) / 0xB5))
+                0x77D, 1, 1, mapping=(lambda x: int((100 * (x[0] - 0x25)) / 0xB5))
             ),
             type=Type.Speed,
+            did=0xF449,
         ),
         SignalConfiguration(
             2,
             "brake",
-            CANSignal(0x7A5, 7, 2, mapping=(lambda x: (100 * (((x[0] <<8) + ((x[1] - 0x75) if x[1] - 0x75 > 0 else 0)) / 0x5E1)))),
+            CANSignal(0x7A5, 2, 2, mapping=(lambda x: (100 * (((x[0] <<8) + ((x[1] - 0x75) if x[1] - 0x75 > 0 else 0)) / 0x5E1)))),
             type=Type.Brake,
-            ident_filter=[0x62, 0x47]
+            did=0x47D4,
         ),
         SignalConfiguration(
             3,
             "gear",
-            CANSignal(0x776, 5, 1, mapping=(lambda x: gear_change_matcher_uds(x[0]))),
+            CANSignal(0x776, 1, 1, mapping=(lambda x: gear_change_matcher_uds(x[0]))),
             type=Type.Gear,
             buttons=[Buttons.DOWN, Buttons.UP],
-            ident_filter=[0x4F, 0xE4],
+            did=0x4FE4,
         ),
         SignalConfiguration(
             4,
             "nitro",
-            CANSignal(0x776, 5, 1, mapping=(lambda x: 1 if x[0] == 0x01 else 0)),
+            CANSignal(0x776, 1, 1, mapping=(lambda x: 1 if x[0] == 0x01 else 0)),
             type=Type.Button,
             buttons=[Buttons.A],
-            ident_filter=[0x1F, 0x02],
+            did=0x1F02,
         ),
         SignalConfiguration(
             5,
             "fire",
-            CANSignal(0x776, 5, 1, mapping=(lambda x: 1 if x[0] == 0x02 else 0)),
+            CANSignal(0x776, 1, 1, mapping=(lambda x: 1 if x[0] == 0x02 else 0)),
             type=Type.Button,
             buttons=[Buttons.B],
-            ident_filter=[0x1F, 0x00],
+            did=0x1F00,
         ),
         SignalConfiguration(
             6,
             "X",
-            CANSignal(0x776, 5, 1, mapping=(lambda x: 1 if x[0] == 0x01 else 0)),
+            CANSignal(0x776, 1, 1, mapping=(lambda x: 1 if x[0] == 0x01 else 0)),
             type=Type.Button,
             buttons=[Buttons.X],
-            ident_filter=[0x1F, 0x00],
+            did=0x1F00,
         ),
         SignalConfiguration(
             7,
             "Y",
-            CANSignal(0x776, 5, 1, mapping=(lambda x: 1 if x[0] == 0x02 else 0)),
+            CANSignal(0x776, 1, 1, mapping=(lambda x: 1 if x[0] == 0x02 else 0)),
             type=Type.Button,
             buttons=[Buttons.Y],
-            ident_filter=[0x1F, 0x02],
+            did=0x1F02,
         ),
     ],
     polling_messages=[
@@ -175,18 +180,24 @@ config_uds = VehicleConfiguration(
             data=[0x03, 0x22, 0x4F, 0xE4, 0x55, 0x55, 0x55, 0x55],
             is_extended_id=False,
             polling_interval=POLLING_INTERVAL_FAST,
+            response_id=0x776,
+            priority=1,
         ),
         PollingMessage(
             arbitration_id=0x713,
             data=[0x03, 0x22, 0xF4, 0x49, 0x55, 0x55, 0x55, 0x55],
             is_extended_id=False,
             polling_interval=POLLING_INTERVAL_FAST,
+            response_id=0x77D,
+            priority=0,
         ),
         PollingMessage(
             arbitration_id=0x73B,
             data=[0x03, 0x22, 0x47, 0xD4, 0x55, 0x55, 0x55, 0x55],
             is_extended_id=False,
             polling_interval=POLLING_INTERVAL_FAST,
+            response_id=0x7A5,
+            priority=0,
         ),
         PollingMessage(
             arbitration_id=0x712,
@@ -195,24 +206,32 @@ config_uds = VehicleConfiguration(
             # data=[0x03, 0x22, 0x39, 0x0C, 0x55, 0x55, 0x55, 0x55],
             is_extended_id=False,
             polling_interval=POLLING_INTERVAL_FAST,
+            response_id=0x77C,
+            priority=0,
         ),
         PollingMessage(
             arbitration_id=0x70C,
             data=[0x03, 0x22, 0x1F, 0x00, 0x55, 0x55, 0x55, 0x55],
             is_extended_id=False,
             polling_interval=POLLING_INTERVAL_SLOW,
+            response_id=0x776,
+            priority=2,
         ),
         PollingMessage(
             arbitration_id=0x70C,
             data=[0x03, 0x22, 0x1F, 0x02, 0x55, 0x55, 0x55, 0x55],
             is_extended_id=False,
             polling_interval=POLLING_INTERVAL_SLOW,
+            response_id=0x776,
+            priority=2,
         ),
         PollingMessage(
             arbitration_id=0x73B,
             data=[0x2, 0x10, 0x03, 0x55, 0x55, 0x55, 0x55, 0x55],
             is_extended_id=False,
-            polling_interval=POLLING_INTERVAL_SLOW
+            polling_interval=POLLING_INTERVAL_SLOW,
+            response_id=0x7A5,
+            priority=3,
         )
     ]
 )
@@ -1,6 +1,7 @@
 from v2g_controller.configuration_helper import (
     SignalConfiguration,
     CANSignal,
+    BitSignal,
     CANBus,
     PollingMessage,
     OperationMode,
@@ -28,33 +29,31 @@ config_internal = VehicleConfiguration(
     steering_max=0.08,
     steering_deadzone=0.1,
     steering_exponent=1.0,
-    read_limiter=10,
+    max_rate=50,
     auto_detect_ids=[0x1d8, 0x261, 0x288, 0x129, 0x545, 0x257, 0x118, 0x3c2],
     configurations=[
         SignalConfiguration(
             id=0,
             name="steering",
-            can_signal=CANSignal(
+            #  SG_ SCCM_steeringAngle: 16|14@1+ (0.1,-819.2) [0|0] "deg" X
+            can_signal=BitSignal(
                 id=297,
-                byte=3, # Bit 16
-                length=2, # 14 bits
-                #  SG_ SCCM_steeringAngle: 16|14@1+ (0.1,-819.2) [0|0] "deg" X
-                mapping=(
-                    lambda x: range_map(
-                        ((((int(x[1]) & 0b00111111) << 8) + x[0]) * 0.1 - 819.2),
-                        -819.2, 819.2, -1.0, 1.0)
-                )
+                start_bit=16,
+                bit_length=14,
+                factor=0.1,
+                offset=-819.2,
+                mapping=(lambda x: range_map(x, -819.2, 819.2, -1.0, 1.0)),
             ),
             type=Type.Steering,
         ),
         SignalConfiguration(
             id=1,
             name="speed",
-            can_signal=CANSignal(
+            can_signal=BitSignal(
                 id=0x118,
-                byte=5, # Bit 32
-                length=1,
-                mapping=(lambda x: x[0] * 0.4), # Pedal position in %
+                start_bit=32,
+                bit_length=8,
+                factor=0.4, # Pedal position in %
             ),
             type=Type.Speed,
         ),
@@ -70,8 +69,8 @@ config_internal = VehicleConfiguration(
         SignalConfiguration(
             id=3,
             name="gear",
-            can_signal=CANSignal(
-                0x118, 3, 1, mapping=(lambda x: tesla_gear_change_matcher(x[0] >> 5))
+            can_signal=BitSignal(
+                0x118, start_bit=21, bit_length=3, mapping=tesla_gear_change_matcher
             ),
             type=Type.Gear,
             buttons=[Buttons.DOWN, Buttons.UP],
@@ -80,9 +79,7 @@ config_internal = VehicleConfiguration(
             id=4,
             name="nitro",
             #  SG_ VCFRONT_lowBeamLeftStatus : 28|2@1+ (1,0) [0|3] ""  Receiver
-            can_signal=CANSignal(
-                0x3f5, 4, 1, mapping=(lambda x: (x[0] & 0b00010000) >> 4)
-            ),
+            can_signal=BitSignal(0x3f5, start_bit=28, bit_length=1),
             type=Type.Button,
             buttons=[Buttons.A],
         ),
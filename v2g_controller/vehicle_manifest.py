@@ -0,0 +1,126 @@
+from importlib import import_module
+from pathlib import Path
+from pkgutil import iter_modules
+
+import v2g_controller.configuration_helper as cfh
+from v2g_controller.configuration_helper import CANBus, OperationMode
+from v2g_controller.helper import debug
+
+
+class VehicleManifest:
+    """
+    Lightweight description of a vehicle configuration.
+
+    Holds everything required to select a vehicle (e.g. for auto-detection)
+    without importing its configuration module, which builds all signal
+    configurations and polling messages.
+
+    Parameters:
+    vehicle: Name of the vehicle configuration.
+    module: Module in vehicle_configurations defining the configuration.
+    operation_mode: OperationMode of the configuration.
+    can_buses: List of CANBus.
+    auto_detect_ids: CAN IDs used for automatic vehicle identification.
+    """
+
+    def __init__(self, vehicle, module, operation_mode: OperationMode, can_buses, auto_detect_ids=[]):
+        self.vehicle = vehicle
+        self.module = module
+        self.operation_mode = operation_mode
+        self.can_buses = can_buses
+        self.auto_detect_ids = auto_detect_ids
+
+    def load(self) -> cfh.VehicleConfiguration:
+        """
+        Imports the configuration module and returns the vehicle configuration.
+        """
+        if self.vehicle not in cfh.vehicle_configurations:
+            import_module(f"v2g_controller.vehicle_configurations.{self.module}")
+        configuration = cfh.vehicle_configurations.get(self.vehicle)
+        if configuration is None:
+            print(f"Error: {self.module} does not define the vehicle {self.vehicle}!")
+            exit(-1)
+        if (
+            configuration.operation_mode != self.operation_mode
+            or configuration.auto_detect_ids != self.auto_detect_ids
+            or [(bus.type, bus.bitrate, bus.data_bitrate) for bus in configuration.can_buses]
+            != [(bus.type, bus.bitrate, bus.data_bitrate) for bus in self.can_buses]
+        ):
+            debug(f"Warning: The manifest of {self.vehicle} differs from its configuration, please update vehicle_manifest.py")
+        return configuration
+
+
+# Keep in sync with the modules in vehicle_configurations.
+# Modules without an entry are still supported, but imported on every start.
+MANIFEST = [
+    VehicleManifest(
+        "ID3_INTERNAL",
+        "configuration_id3",
+        OperationMode.Internal,
+        [CANBus("fd", 500000, 2000000), CANBus("standard", 500000)],
+    ),
+    VehicleManifest(
+        "ID3_UDS",
+        "configuration_id3",
+        OperationMode.UDS,
+        [CANBus("standard", 500000)],
+        auto_detect_ids=[0x77c, 0x77d, 0x7a5, 0x776],
+    ),
+    VehicleManifest(
+        "TESLA_MODEL_3",
+        "tesla_model_3",
+        OperationMode.Internal,
+        [CANBus("standard", 500000)],
+        auto_detect_ids=[0x1d8, 0x261, 0x288, 0x129, 0x545, 0x257, 0x118, 0x3c2],
+    ),
+]
+
+_manifests = None
+
+
+def manifests() -> dict:
+    """
+    Returns all vehicles as dict of vehicle name -> VehicleManifest.
+
+    Configuration modules without a manifest entry are imported to build their entries.
+    """
+    global _manifests
+    if _manifests is None:
+        _manifests = {manifest.vehicle: manifest for manifest in MANIFEST}
+        listed = {manifest.module for manifest in MANIFEST}
+        package_dir = Path(__file__).resolve().parent.joinpath("vehicle_configurations")
+        for (_, module_name, _) in iter_modules([package_dir]):
+            if module_name in listed:
+                continue
+            debug(f"Vehicle configuration module {module_name} is not listed in vehicle_manifest.py, importing it")
+            known = set(cfh.vehicle_configurations)
+            import_module(f"v2g_controller.vehicle_configurations.{module_name}")
+            for vehicle, configuration in cfh.vehicle_configurations.items():
+                if vehicle not in known and vehicle not in _manifests:
+                    _manifests[vehicle] = VehicleManifest(
+                        vehicle,
+                        module_name,
+                        configuration.operation_mode,
+                        configuration.can_buses,
+                        configuration.auto_detect_ids,
+                    )
+    return _manifests
+
+
+def load(vehicle) -> cfh.VehicleConfiguration:
+    """
+    Returns the configuration of a vehicle, or None if the vehicle is not configured.
+    """
+    manifest = manifests().get(vehicle)
+    if manifest is None:
+        return None
+    return manifest.load()
+
+
+def load_all() -> dict:
+    """
+    Loads all vehicle configurations and returns cfh.vehicle_configurations.
+    """
+    for manifest in manifests().values():
+        manifest.load()
+    return cfh.vehicle_configurations